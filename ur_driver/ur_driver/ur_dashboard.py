@@ -1,9 +1,14 @@
+import logging
+import select
 import socket
-from time import sleep
+from time import sleep, monotonic
+from typing import Optional
 
 from paramiko import SSHClient, AutoAddPolicy, SSHException
 from scp import SCPClient, SCPException
 
+log = logging.getLogger(__name__)
+
 class UR_DASHBOARD():
     """
     This is a python interface to communicate the UR Dashboard server. 
@@ -12,6 +17,8 @@ class UR_DASHBOARD():
     Each command should be terminated by a `\n` also called a newline.
     """
 
+    POWERED_DOWN_MODES = frozenset({"POWER_OFF", "BOOTING", "POWER_ON", "IDLE"})
+
     def __init__(self, hostname:str = "146.137.240.38", PORT: int = 29999) -> None:
         """Constructor for the UR class.
         :param hostname: Hostname or ip.
@@ -20,6 +27,7 @@ class UR_DASHBOARD():
         self.hostname = hostname
         self.port = PORT
         self.connection = None
+        self.rfile = None
         self.connection_error = False
         self.robot_mode = None
         self.safety_status = None
@@ -30,97 +38,212 @@ class UR_DASHBOARD():
         self.initialize()
 
     def connect(self) -> None:
-        """Create a socket"""
+        """Create a socket, replacing the current one if there is any"""
+        if self.connection:
+            self.disconnect()
+
         try:
             self.connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Commands are tiny, send them without waiting to coalesce
+            self._enable_keepalive()
             self.connection.settimeout(5) # Socket will wait 5 seconds till it recieves the response
             self.connection.connect((self.hostname,self.port))
+            self.rfile = self.connection.makefile("rb") # Buffered reader so that newline terminated replies can be read as soon as they arrive
+            log.info(self.rfile.readline().decode("utf-8").strip()) # Dashboard server greets every new connection with a single line
+            self.connection_error = False
 
         except socket.error as err:
             print("UR dashboard could not establish connection")
             print(err)
+            self.disconnect()
             self.connection_error = True
-            
+
+    def _enable_keepalive(self, idle: int = 30, interval: int = 5, count: int = 3) -> None:
+        """Let the kernel probe the long lived connection so that a dead controller is noticed without waiting on a command"""
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"): # Probe timing options are not available on every platform
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
 
     def disconnect(self) -> None:
         """Close the socket"""
-        self.connection.close()
-
-    def send_command(self, command, response_delay:float = 0.1) -> str:
-
-        # print(">> " + command)
+        if self.rfile:
+            self.rfile.close()
+        if self.connection:
+            self.connection.close()
+        self.rfile = None
+        self.connection = None
 
+    def send_command(self, command) -> str:
+        """Send a single command and return its reply, or None if the dashboard could not be reached"""
         try:
+            return self.send_commands([command])[0]
+        except ConnectionError as err:
+            print(err)
+            return None
+
+    def send_commands(self, commands: list) -> list:
+        """Send several commands in a single write and return their replies in the same order.
+        The dashboard server handles newline separated commands one by one, so the replies can be read back sequentially.
+        A connection that the server has closed, e.g. after a controller reboot, is reopened before writing, and a connection that
+        breaks while writing is reopened and the commands are written once more. Once the commands are written
+        they may already have run, so commands like play or brake release are not resent when the replies do not arrive.
+        Raises a ConnectionError if the commands could not be sent or their replies were not received.
+        """
+        for attempt in range(2):
+            if self.connection and self._connection_closed_by_peer():
+                log.warning("Dashboard server closed the connection, reconnecting")
+                self.disconnect()
             if not self.connection:
                 self.connect()
+            if not self.connection:
+                break
+
+            try:
+                self._write_commands(commands)
+            except (BrokenPipeError, ConnectionResetError) as err:
+                log.warning("Dashboard connection lost (%s), reconnecting", err)
+                self.disconnect()
+                continue
+
+            try:
+                return self._read_replies(commands)
+            except OSError as err:
+                # A late reply would be read as the answer to the next command, so the connection is dropped
+                self.disconnect()
+                raise ConnectionError("No reply from the UR dashboard to {}: {}".format(commands, err)) from err
+
+        raise ConnectionError("UR dashboard is not reachable, {} not sent".format(commands))
+
+    def _connection_closed_by_peer(self) -> bool:
+        """Check without blocking whether the server closed the connection. Writing to such a socket still succeeds,
+        only the following read hits the end of the stream, when the commands may already have been received."""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            # No reply is outstanding between exchanges, so a readable socket either has an unsolicited line or is at the end of the stream
+            return bool(readable) and self.connection.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+    def _write_commands(self, commands: list) -> None:
+        """Write the commands on the current connection"""
+        log.debug(">> %s", commands)
+        self.connection.sendall(b"".join(command.encode("ascii") + b"\n" for command in commands))
+
+    def _read_replies(self, commands: list) -> list:
+        """Read one reply line for each of the written commands"""
+        responses = []
+        for command in commands:
+            response = self.rfile.readline().decode("utf-8") # Every dashboard reply is terminated by a newline, socket timeout bounds the wait
+            if not response:
+                raise ConnectionResetError("Dashboard server closed the connection")
+            log.debug("<< %s", response[:-1])
+            responses.append(response.strip())
+
+        return responses
+
+    @staticmethod
+    def _parse_status_reply(output: str) -> str:
+        """Return the value of a "Name: VALUE" status reply"""
+        if not output:
+            return output
+        output = output.split(' ')
+        try:
+            if "\n" in output[1]:
+                return output[1].split("\n")[0]
+            else:
+                return output[1]
+        except IndexError:
+            print("Depricated output!")
+            return output
 
-            self.connection.sendall((command.encode("ascii") + b"\n")) 
-            
-            sleep(response_delay) # Wait for response delay
-            response = self.connection.recv(4096).decode("utf-8")
-                
-            if response.find('Connected: Universal Robots Dashboard Server') != -1:
-                print("Connected: Universal Robots Dashboard Server")
-                response = response[45:]
-
-            print("<< " + response[:-1])
+    def _wait_for_state(self, get_state, target: str, timeout: float, poll_interval: float = 0.1) -> bool:
+        """Poll a dashboard state query until it reports the target value or the timeout expires"""
+        start_time = monotonic()
+        while monotonic() - start_time < timeout:
+            state = get_state()
+            if isinstance(state, str) and state.upper() == target:
+                return True
+            sleep(poll_interval)
 
-            return response.strip()
+        print("Timed out waiting for " + target)
+        return False
 
-        except Exception as err:
-            print(err)
+    @staticmethod
+    def _upper(reply: str) -> str:
+        """Upper case a state reply, passing on None when the dashboard did not answer"""
+        return reply.upper() if isinstance(reply, str) else None
 
     def get_overall_robot_status(self) -> None:
-        """Get robot status"""
-        self.robot_mode = self.get_robot_mode().upper()
-        self.operational_mode = self.get_operational_mode().upper()
-        self.safety_status = self.get_safety_status()
-        self.remote_control_status = self.is_in_remote_control()
+        """Get robot status, all states are set to None if the dashboard does not answer"""
+        try:
+            robot_mode, operational_mode, safety_status, remote_control_status = self.send_commands(["robotmode", "get operational mode", "safetystatus", "is in remote control"])
+        except ConnectionError as err:
+            print(err)
+            robot_mode = operational_mode = safety_status = remote_control_status = None
+        self.robot_mode = self._upper(self._parse_status_reply(robot_mode))
+        self.operational_mode = self._upper(operational_mode)
+        self.safety_status = self._upper(self._parse_status_reply(safety_status))
+        self.remote_control_status = remote_control_status
 
-    def initialize(self) -> None:
+    def initialize(self, max_attempts: int = 10) -> None:
         if self.connection_error:
             return
-            
-        self.get_overall_robot_status()
 
-        if self.safety_status == 'PROTECTIVE_STOP':
-            print("Unlocking protective stop")
-            self.unlock_protective_stop()
-
-        elif "NORMAL" not in self.safety_status:   #self.safety_status != "ROBOT_EMERGENCY_STOP" or self.safety_status != "SYSTEM_EMERGENCY_STOP":
-            print("Restarting safety")
-            self.close_safety_popup()
-            self.restart_safety()        
-
-        if self.operational_mode == "MANUAL":
-            print("Operation mode is currently set to MANUAL, switching to AUTOMATIC")
-            self.set_operational_mode("automatic")
-
-        if self.remote_control_status == False:
-            print("Robot is not in remote control")
-        
-        if self.robot_mode == 'RUNNING' and "NORMAL" in self.safety_status:
-            print('Robot is initialized')
-            return
-        
-        elif self.robot_mode == "POWER_OFF" or self.robot_mode == "BOOTING" or self.robot_mode == "POWER_ON" or self.robot_mode == "IDLE":
-            print("Powering on the robot and releasing brakes")
-            self.brake_release()
+        self.get_overall_robot_status()
 
-        return self.initialize()
+        for attempt in range(max_attempts):
+            state_changed = False
+
+            if self.robot_mode is None or self.safety_status is None:
+                # The dashboard did not answer, this attempt only queries the states again
+                print("Robot status is unknown, retrying")
+                self.get_overall_robot_status()
+                continue
+
+            if self.safety_status == 'PROTECTIVE_STOP':
+                print("Unlocking protective stop")
+                self.unlock_protective_stop()
+                self.safety_status = self._upper(self.get_safety_status())
+                state_changed = True
+
+            elif "NORMAL" not in self.safety_status:   #self.safety_status != "ROBOT_EMERGENCY_STOP" or self.safety_status != "SYSTEM_EMERGENCY_STOP":
+                print("Restarting safety")
+                self.close_safety_popup()
+                self.restart_safety()
+                # Restarting safety also releases the brakes, both states need to be refreshed
+                self.safety_status = self._upper(self.get_safety_status())
+                self.robot_mode = self._upper(self.get_robot_mode())
+                state_changed = True
+
+            if self.operational_mode == "MANUAL":
+                print("Operation mode is currently set to MANUAL, switching to AUTOMATIC")
+                self.set_operational_mode("automatic")
+                self.operational_mode = self._upper(self.get_operational_mode())
+
+            if self.remote_control_status == False:
+                print("Robot is not in remote control")
+
+            if self.robot_mode == 'RUNNING' and "NORMAL" in (self.safety_status or ""):
+                print('Robot is initialized')
+                return
+
+            elif self.robot_mode in self.POWERED_DOWN_MODES:
+                print("Powering on the robot and releasing brakes")
+                self.brake_release()
+                self.robot_mode = self._upper(self.get_robot_mode())
+                state_changed = True
+
+            if not state_changed:
+                # Nothing was done on this attempt, the robot may still be transitioning between states
+                self.get_overall_robot_status()
+
+        print("Robot could not be initialized after {} attempts".format(max_attempts))
 
     def get_robot_mode(self) -> str:
         """Return the robot mode"""
-        output = self.send_command("robotmode")
-        output = output.split(' ')
-        try:
-            if "\n" in output[1]:
-                return output[1].split("\n")[0]
-            else:
-                return output[1]
-        except IndexError:
-            print("Depricated output!")
-            return output
+        return self._parse_status_reply(self.send_command("robotmode"))
                 
     def quit(self) -> str:
         '''Closes connection to robot'''
@@ -141,7 +264,7 @@ class UR_DASHBOARD():
     def brake_release(self) -> str:
         '''Releases the brakes'''
         output = self.send_command('brake release')
-        sleep(20)
+        self._wait_for_state(self.get_robot_mode, "RUNNING", timeout = 25)
         return output
 
     def unlock_protective_stop(self) -> str:
@@ -155,24 +278,14 @@ class UR_DASHBOARD():
 
     def restart_safety(self) -> str:
         output = self.send_command('restart safety')
-        sleep(10)
+        self._wait_for_state(self.get_safety_status, "NORMAL", timeout = 10)
         self.disconnect()
         self.connect()
         output2 = self.brake_release()
         return output
         
     def get_safety_status(self) -> str:
-        output = self.send_command('safetystatus')
-        output = output.split(' ')
-        # print(output)
-        try:
-            if "\n" in output[1]:
-                return output[1].split("\n")[0]
-            else:
-                return output[1]
-        except IndexError:
-            print("Depricated output!")
-            return output
+        return self._parse_status_reply(self.send_command('safetystatus'))
                 
     def get_operational_mode(self) -> str:
         return self.send_command('get operational mode')
@@ -225,6 +338,13 @@ class UR_DASHBOARD():
     
     def get_program_run_status(self) -> str:
         return self.send_command('running')
+
+    def is_program_running(self) -> Optional[bool]:
+        """Returns True while a program is running, or None if the dashboard did not answer"""
+        output = self.get_program_run_status()
+        if not output:
+            return None
+        return output.strip().lower().endswith("true")
     
     def run_program(self) -> str:
         return self.send_command('play')
@@ -237,6 +357,7 @@ class UR_DASHBOARD():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
     robot = UR_DASHBOARD("164.54.116.129")
     robot.get_loaded_program()
     robot.get_program_state()
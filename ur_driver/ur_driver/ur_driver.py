@@ -4,15 +4,62 @@ import threading
 import socket 
 
 from multiprocessing.connection import wait
-from time import sleep
-from copy import deepcopy
+from time import sleep, time
 import json
-from math import radians, degrees
+from math import radians, degrees, pi
+from contextlib import contextmanager
+
+import numpy as np
+import math3d as m3d
 
 from ur_dashboard import UR_DASHBOARD
-from ur_tools import *
+from ur_tools import FingerGripperController, WMToolChangerController
 from urx import Robot, RobotException
 
+def _pose_script(pose) -> str:
+    """Formats a pose as a URScript pose literal"""
+    return "p[" + ", ".join(str(float(value)) for value in pose) + "]"
+
+class ScriptBatcher():
+    """Collects URScript motion statements, so a sequence of motions can be sent to the controller as one program"""
+    def __init__(self) -> None:
+        self.lines = []
+
+    def movej(self, joints, acc, vel) -> None:
+        """Queues a joint move to the given joint positions"""
+        self.lines.append("movej([{}], a={}, v={})".format(", ".join(str(float(value)) for value in joints), acc, vel))
+
+    def movel(self, pose, acc, vel, radius: float = 0) -> None:
+        """Queues a linear move to the given pose. A nonzero radius blends through the pose instead of stopping on it"""
+        self.lines.append("movel({}, a={}, v={}, r={})".format(_pose_script(pose), acc, vel, radius))
+
+    def translate_tool(self, vect, acc, vel) -> None:
+        """Queues a linear move relative to the current tool frame"""
+        self.lines.append("movel(pose_trans(get_actual_tcp_pose(), {}), a={}, v={})".format(_pose_script(list(vect) + [0, 0, 0]), acc, vel))
+
+    def rotate_wrist(self, angle, acc, vel) -> None:
+        """Queues a joint move that turns only the last wrist joint by the given angle, starting from wherever the arm is"""
+        self.lines += [
+            "joints = get_actual_joint_positions()",
+            "joints[5] = joints[5] + {}".format(angle),
+            "movej(joints, a={}, v={})".format(acc, vel),
+        ]
+
+    def speedl_tool(self, velocities, acc, min_time) -> None:
+        """Queues a tool frame speed command, rotated into the base frame like urx speedl_tool does"""
+        self.lines += [
+            "tcp = get_actual_tcp_pose()",
+            "tool_rotation = p[0, 0, 0, tcp[3], tcp[4], tcp[5]]",
+            "linear = pose_trans(tool_rotation, {})".format(_pose_script(list(velocities[:3]) + [0, 0, 0])),
+            "angular = pose_trans(tool_rotation, {})".format(_pose_script(list(velocities[3:]) + [0, 0, 0])),
+            "speedl([linear[0], linear[1], linear[2], angular[0], angular[1], angular[2]], a={}, t={})".format(acc, min_time),
+            "stopl({})".format(acc),
+        ]
+
+    def program(self, name: str = "ur_driver_block") -> str:
+        """Wraps the queued statements into a URScript program"""
+        return "def {}():\n".format(name) + "".join("  " + line + "\n" for line in self.lines) + "end\n"
+
 class Connection():
     """Connection to the UR robot to be shared within UR driver """
     def __init__(self,  hostname:str = "146.137.240.38", PORT: int = 29999) -> None:
@@ -28,17 +75,32 @@ class Connection():
         Description: Create conenction to the UR robot
         """
 
+        delay = 0.25
         for i in range(10):
             try:
                 self.connection = Robot(self.hostname)
 
             except socket.error:
                 print("Trying robot connection ...")
-                sleep(10)
+                sleep(delay)
+                delay = min(delay * 2, 4.0) # Back off exponentially, capped at a few seconds
 
             else:
                 print('Successful ur connection')
-                break
+                self._disable_nagle()
+                return
+
+        raise ConnectionError("Could not connect to the UR robot at {}".format(self.hostname))
+
+    def _disable_nagle(self):
+        """
+        Description: Sets TCP_NODELAY on the urx sockets, so small URScript programs are sent immediately instead of being coalesced by Nagle's algorithm
+        """
+        # urx does not expose its sockets, so look them up by their internal names
+        sockets = [getattr(self.connection.secmon, "_s_secondary", None), getattr(getattr(self.connection, "rtmon", None), "_rtSock", None)]
+        for sock in sockets:
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     def disconnect_ur(self):
         """
@@ -78,33 +140,190 @@ class UR():
         self.accel_radss = 1.200
         self.blend_radius_m = 0.001
         self.ref_frame = [0,0,0,0,0,0]
-        self.robot_current_joint_angles = None
-        self.get_movement_state()
+        self._gripper = None
+        self._pipette = None
+        self._home_programs = {}
         #TODO: get the information of what is the current tool attached to UR. Maybe keep the UR unattached after the tools were used? Run a senity check at the beginning to findout if a tool is connected 
     
     def get_movement_state(self):
-        current_location = self.ur_connection.getj()
-        current_location = [ '%.2f' % value for value in current_location] #rounding to 3 digits
-        # print(current_location)
-        if self.robot_current_joint_angles == current_location:
+        """
+        Description: Reports READY when all joints are at rest. The joint velocities decide this from a single sample,
+                     where comparing joint positions needed two samples and missed slow motions.
+        """
+        joint_data = self.ur_connection.secmon.get_all_data()["JointData"]
+        joint_speeds = np.array([joint_data["qd_actual%d" % i] for i in range(6)])
+        if np.all(np.abs(joint_speeds) < 1e-4):
             movement_state = "READY"
         else:
             movement_state = "BUSY"
 
-        self.robot_current_joint_angles = current_location
-
         return movement_state
 
+    @contextmanager
+    def batch(self, timeout: float = 60):
+        """
+        Description: Yields a ScriptBatcher to queue motions on. When the block exits, the queued motions are sent to the controller as one program,
+                     so the whole sequence costs a single submission, and the call blocks until the controller finished running it.
+                     Nothing is sent if the block raises.
+        """
+        script = ScriptBatcher()
+        yield script
+        if script.lines:
+            self._send_script(script.program(), timeout = timeout)
+
+    def _send_script(self, program: str, timeout: float = 60, start_timeout: float = 2) -> None:
+        """
+        Description: Sends a URScript program to the controller and waits until it finished running.
+                     Raises a RobotException if the program does not start within start_timeout or is still running after the timeout.
+        """
+        joints_before = self._joint_positions(self.ur_connection.secmon.get_all_data())
+        self.ur_connection.send_program(program)
+
+        # Wait for the controller to pick the program up, then for it to finish
+        start_time = time()
+        while True:
+            # Both flags come from the same state packet, so a moved robot that is not running has finished the program
+            state = self.ur_connection.secmon.get_all_data()
+            if state["RobotModeData"]["isProgramRunning"]:
+                break
+            # A short program can start and finish between two state packets, the robot having moved shows that it ran
+            if np.any(np.abs(self._joint_positions(state) - joints_before) > 1e-4):
+                return
+            if time() - start_time > start_timeout:
+                raise RobotException("Program did not start within {} s".format(start_timeout))
+            self.ur_connection.secmon.wait()
+
+        if not self._wait_until_idle(timeout = timeout):
+            raise RobotException("Program did not finish within {} s".format(timeout))
+
+    @staticmethod
+    def _joint_positions(state: dict) -> np.ndarray:
+        """
+        Description: Returns the actual joint positions of a secondary interface state snapshot.
+        """
+        joint_data = state["JointData"]
+        return np.array([joint_data["q_actual%d" % i] for i in range(6)])
+
+    def _wait_until_idle(self, timeout: float = None) -> bool:
+        """
+        Description: Blocks until the controller reports that no program is running anymore.
+                     Returns False if the timeout expired before that.
+        """
+        start_time = time()
+        while self.ur_connection.is_program_running():
+            if timeout is not None and time() - start_time > timeout:
+                return False
+            # Wake up on the next secondary interface state packet instead of a timer, the program flag can only change with one
+            self.ur_connection.secmon.wait()
+        return True
+
+    def _get_gripper(self, gripper_open:int = None, gripper_close:int = None) -> FingerGripperController:
+        """
+        Description: Returns the finger gripper controller, connecting to the gripper only on first use.
+                     The connection is kept open until the tool is changed or the UR object is closed.
+        """
+        if self._gripper is None:
+            gripper = FingerGripperController(hostname = self.hostname, ur = self.ur_connection)
+            if not gripper.connect_gripper():
+                raise Exception("Failed to connect to the gripper")
+            self._adopt_gripper(gripper)
+
+        # Positions requested by a previous operation must not carry over
+        self._gripper.gripper_open, self._gripper.gripper_close = self._gripper_defaults
+        if gripper_open:
+            self._gripper.gripper_open = gripper_open
+        if gripper_close:
+            self._gripper.gripper_close = gripper_close
+
+        return self._gripper
+
+    def _adopt_gripper(self, gripper: FingerGripperController) -> None:
+        """
+        Description: Caches a connected gripper controller together with its default open/close positions.
+        """
+        self._gripper = gripper
+        self._gripper_defaults = (gripper.gripper_open, gripper.gripper_close)
+
+    def _home_with_gripper(self, home_location = None) -> None:
+        """
+        Description: Homes the robot while connecting the gripper on a background thread, so the gripper handshake is hidden under the homing motion.
+                     The background connection only adopts an already active gripper, activation would move the fingers while the arm moves.
+                     If the gripper is not active or the background connection fails, _get_gripper connects the regular way once the robot is still.
+        """
+        if self._gripper is not None:
+            self.home(home_location)
+            return
+
+        gripper = FingerGripperController(hostname = self.hostname, ur = self.ur_connection)
+        connected = []
+        # Tool communication is not reset and the gripper is not activated from the background, either would interfere with the homing move
+        connector = threading.Thread(target = lambda: connected.append(gripper.connect_gripper(reset_tool_communication = False, activate = False)), daemon = True)
+        connector.start()
+        self.home(home_location)
+        connector.join()
+
+        if connected and connected[0]:
+            self._adopt_gripper(gripper)
+
+    def _get_pipette(self) -> "TricontinentPipetteController":
+        """
+        Description: Returns the pipette controller, connecting to the pipette only on first use.
+        """
+        if self._pipette is None:
+            from ur_tools import TricontinentPipetteController
+            self._pipette = TricontinentPipetteController(hostname = self.hostname, ur = self.ur_connection, pipette_ip=self.hostname)
+            self._pipette.connect_pipette()
+
+        return self._pipette
+
+    def _release_tools(self) -> None:
+        """
+        Description: Disconnects the cached end-effector controllers, so the next operation reconnects.
+        """
+        if self._gripper is not None:
+            self._gripper.disconnect_gripper()
+            self._gripper = None
+        if self._pipette is not None:
+            self._pipette.disconnect_pipette()
+            print("Disconnecting from the pipette")
+            self._pipette = None
+
+    def close(self) -> None:
+        """
+        Description: Disconnects the end-effectors, the UR robot and the dashboard.
+        """
+        self._release_tools()
+        self.ur.disconnect_ur()
+        self.ur_dashboard.disconnect()
+
+    def _home_location(self, home_location = None) -> list:
+        """
+        Description: Returns the given home location, or the default home joint positions.
+        """
+        if home_location:
+            return home_location
+        return [-1.355567757283346, -2.5413090191283167, 1.8447726408587855, -0.891581193809845, -1.5595606009112757, 3.3403327465057373]
+
     def home(self, home_location = None):
         """
         Description: Moves the robot to the home location.
         """
+        home_loc = self._home_location(home_location)
+
+        # Compound operations home on both entry and exit, so back to back operations would home twice in a row.
+        # The joint angles come from the cached secondary interface data, so this check costs no round trip.
+        if not self.ur_connection.is_program_running() and all(abs(current - goal) < 1e-3 for current, goal in zip(self.ur_connection.getj(), home_loc)):
+            return
+
+        # Homing is the most frequent motion, so its URScript program is only formatted once per home location
+        program = self._home_programs.get(tuple(home_loc))
+        if program is None:
+            script = ScriptBatcher()
+            script.movej(home_loc, 2, 2)
+            program = self._home_programs[tuple(home_loc)] = script.program("goto_home")
+
         print("Homing the robot...")
-        if home_location:
-            home_loc = home_location
-        else:
-            home_loc = [-1.355567757283346, -2.5413090191283167, 1.8447726408587855, -0.891581193809845, -1.5595606009112757, 3.3403327465057373]
-        self.ur_connection.movej(home_loc,2,2)
+        self._send_script(program)
         # sleep(3.5)
 
         print("Robot homed")
@@ -113,6 +332,7 @@ class UR():
         """
             Picks up a tool using the given tool location
         """
+        self._release_tools() # The cached end-effector connections belong to the tool that is being swapped
         self.ur_connection.set_payload(payload)
         wingman_tool = WMToolChangerController(tool_location = tool_loc, docking_axis = docking_axis, ur = self.ur_connection, tool = tool_name)
         self.home(home)
@@ -123,6 +343,7 @@ class UR():
         """
             Picks up a tool using the given tool location
         """
+        self._release_tools()
         wingman_tool = WMToolChangerController(tool_location = tool_loc, docking_axis = docking_axis, ur = self.ur_connection, tool = tool_name)
         self.home(home)
         wingman_tool.place_tool()
@@ -135,26 +356,19 @@ class UR():
         if not source or not target:
             raise Exception("Please provide both the source and target loactions to make a transfer")
         
-        self.home(home)
+        self._home_with_gripper(home)
         
         try:
-            gripper_controller = FingerGripperController(hostname = self.hostname, ur = self.ur_connection)
-            gripper_controller.connect_gripper()
-
-            if gripper_open:
-                gripper_controller.gripper_open = gripper_open
-            if gripper_close:
-                gripper_controller.gripper_close = gripper_close
+            gripper_controller = self._get_gripper(gripper_open = gripper_open, gripper_close = gripper_close)
 
             gripper_controller.transfer(home = home, source = source, target = target,source_approach_axis = source_approach_axis, target_approach_axis = target_approach_axis, source_approach_distance = source_approach_distance, target_approach_distance = target_approach_distance)
             print('Finished transfer')
-            gripper_controller.disconnect_gripper()
 
         except Exception as err:
             print(err)
+            self._release_tools()
 
         finally:
-            gripper_controller.disconnect_gripper()
             self.home(home)
 
     def gripper_screw_transfer(self, home:list = None, target:list = None, screwdriver_loc: list = None, screw_loc: list = None, screw_time:float = 9, gripper_open:int = None, gripper_close:int = None) -> None:
@@ -162,50 +376,41 @@ class UR():
         Using custom made screwdriving solution.
         """
 
-        self.home(home)
+        self._home_with_gripper(home)
 
         try:
-            gripper_controller = FingerGripperController(hostname = self.hostname, ur = self.ur_connection)
-            gripper_controller.connect_gripper()
-
-            if gripper_open:
-                gripper_controller.gripper_open = gripper_open
-            if gripper_close:
-                gripper_controller.gripper_close = gripper_close
+            gripper_controller = self._get_gripper(gripper_open = gripper_open, gripper_close = gripper_close)
 
             gripper_controller.pick(pick_goal = screwdriver_loc)
 
             # # Pick screw
-            self.home(home)
-            above_goal = deepcopy(screw_loc)
-            above_goal[2] += 0.06
-            self.ur_connection.movel(above_goal, self.acceleration, self.velocity)
-            self.ur_connection.movel(screw_loc, 0.2, 0.2)
-            self.ur_connection.movel(above_goal, self.acceleration, self.velocity)
+            above_goal = [*screw_loc[:2], screw_loc[2] + 0.06, *screw_loc[3:]]
 
             # Move to the target location
-            above_target = deepcopy(target)
-            above_target[2] += 0.03
-            self.ur_connection.movel(above_target, self.acceleration, self.velocity)
-            self.ur_connection.movel(target, 0.2, 0.2)
+            above_target = [*target[:2], target[2] + 0.03, *target[3:]]
 
             target_pose = [0,0,0.00021,0,0,3.14] #Setting the screw drive motion
             print("Screwing down")
 
-            self.ur_connection.speedl_tool(target_pose,2, screw_time) # This will perform screw driving motion for defined number of seconds
-            sleep(screw_time+0.5)
-
-            self.ur_connection.translate_tool([0,0,-0.03],0.5,0.5)
-            self.home(home)
-
-            gripper_controller.place(place_goal=hex_key)
+            # The homing moves around the screw driving are part of the same program
+            with self.batch() as script:
+                script.movej(self._home_location(home), 2, 2)
+                script.movel(above_goal, self.acceleration, self.velocity)
+                script.movel(screw_loc, 0.2, 0.2)
+                # Only pass through the waypoints on the way up and across, the robot still stops on the contact poses
+                script.movel(above_goal, self.acceleration, self.velocity, radius = self.blend_radius_m)
+                script.movel(above_target, self.acceleration, self.velocity, radius = self.blend_radius_m)
+                script.movel(target, 0.2, 0.2)
+                script.speedl_tool(target_pose, 2, screw_time) # This will perform screw driving motion for defined number of seconds
+                script.translate_tool([0,0,-0.03], 0.5, 0.5)
+                script.movej(self._home_location(home), 2, 2)
+
+            gripper_controller.place(place_goal=screwdriver_loc)
             self.home(home)
 
         except Exception as err:
             print(err)
-
-        finally:
-            gripper_controller.disconnect_gripper()
+            self._release_tools()
 
     def gripper_unscrew(self, home:list = None, target:list = None, screwdriver_loc: list = None, screw_loc: list = None, screw_time:float = 10, gripper_open:int = None, gripper_close:int = None) -> None:
         """Perform unscrewing"""
@@ -213,109 +418,93 @@ class UR():
     
     def remove_cap(self, home:list = None, source:list = None, target:list = None, gripper_open:int = None, gripper_close:int = None) -> None:
         """Removes the cap"""
-        self.home(home)
+        self._home_with_gripper(home)
 
         try:
-            gripper_controller = FingerGripperController(hostname = self.hostname, ur = self.ur_connection)
-            gripper_controller.connect_gripper()
-            if gripper_open:
-                gripper_controller.gripper_open = gripper_open
-            if gripper_close:
-                gripper_controller.gripper_close = gripper_close
+            gripper_controller = self._get_gripper(gripper_open = gripper_open, gripper_close = gripper_close)
 
             gripper_controller.open_gripper()
-            above_goal = deepcopy(source)
-            above_goal[2] += 0.06
-            self.ur_connection.movel(above_goal, self.acceleration, self.velocity)
-            self.ur_connection.movel(source, 0.2, 0.2)
+            above_goal = [*source[:2], source[2] + 0.06, *source[3:]]
+            with self.batch() as script:
+                script.movel(above_goal, self.acceleration, self.velocity)
+                script.movel(source, 0.2, 0.2)
 
             gripper_controller.close_gripper()
             
             target_pose = [0,0,-0.001,0,0,-3.14] #Setting the screw drive motion
             print("Removing cap")
             screw_time = 7
-            self.ur_connection.speedl_tool(target_pose,2, screw_time) # This will perform screw driving motion for defined number of seconds
-            sleep(screw_time+0.5)
-            self.ur_connection.translate_tool([0,0,-0.03],0.5,0.5)
+            with self.batch() as script:
+                script.speedl_tool(target_pose, 2, screw_time) # This will perform screw driving motion for defined number of seconds
+                script.translate_tool([0,0,-0.03], 0.5, 0.5)
+                script.movej(self._home_location(home), 2, 2)
             
-            self.home(home)
             gripper_controller.place(place_goal=target)
             self.home(home)
 
         except Exception as err:
             print(err)
+            self._release_tools()
 
     def place_cap(self, home:list = None, source:list = None, target:list = None, gripper_open:int = None, gripper_close:int = None) -> None:
         """Places the cap back"""
-        self.home(home)
+        self._home_with_gripper(home)
 
         try:
-            gripper_controller = FingerGripperController(hostname = self.hostname, ur = self.ur_connection)
-            gripper_controller.connect_gripper()
-            if gripper_open:
-                gripper_controller.gripper_open = gripper_open
-            if gripper_close:
-                gripper_controller.gripper_close = gripper_close
+            gripper_controller = self._get_gripper(gripper_open = gripper_open, gripper_close = gripper_close)
 
             gripper_controller.pick(pick_goal= source)
-            self.home(home)
 
-            above_goal = deepcopy(target)
-            above_goal[2] += 0.06
-            self.ur_connection.movel(above_goal, self.acceleration, self.velocity)
-            self.ur_connection.movel(target, 0.1, 0.1)
+            above_goal = [*target[:2], target[2] + 0.06, *target[3:]]
 
             # gripper_controller.close_gripper()
             
             target_pose = [0,0,0.0001,0,0,3.14] #Setting the screw drive motion
             print("Placing cap")
             screw_time = 6
-            self.ur_connection.speedl_tool(target_pose,2, screw_time) # This will perform screw driving motion for defined number of seconds
-            sleep(screw_time+0.5)
+            with self.batch() as script:
+                script.movej(self._home_location(home), 2, 2)
+                script.movel(above_goal, self.acceleration, self.velocity)
+                script.movel(target, 0.1, 0.1)
+                script.speedl_tool(target_pose, 2, screw_time) # This will perform screw driving motion for defined number of seconds
 
             gripper_controller.open_gripper()
-            self.ur_connection.translate_tool([0,0,-0.03],0.5,0.5)
-            self.home(home)
+            with self.batch() as script:
+                script.translate_tool([0,0,-0.03], 0.5, 0.5)
+                script.movej(self._home_location(home), 2, 2)
 
 
         except Exception as err:
             print(err)
+            self._release_tools()
 
     def pick_and_flip_object(self, home:list = None, target: list = None, approach_axis:str = None, target_approach_distance: float = None, gripper_open:int = None, gripper_close:int = None) -> None:
         '''
         Pick an object then flips it and puts it back to the same location
         '''
 
-        self.home(home)
+        self._home_with_gripper(home)
 
         try:
-            gripper_controller = FingerGripperController(hostname = self.hostname, ur = self.ur_connection)
-            gripper_controller.connect_gripper()
-
-            if gripper_open:
-                gripper_controller.gripper_open = gripper_open
-            if gripper_close:
-                gripper_controller.gripper_close = gripper_close
+            gripper_controller = self._get_gripper(gripper_open = gripper_open, gripper_close = gripper_close)
 
             gripper_controller.pick(pick_goal = target, approach_axis = approach_axis)
-    
-            cur_j = self.ur_connection.getj()
-            rotate_j = cur_j 
-            rotate_j[5] += radians(180) 
-            robot.ur_connection.movej(rotate_j,0.6,0.6)
-
-            cur_l = self.ur_connection.getl()
-            target[3] = cur_l[3]
-            target[4] = cur_l[4]
-            target[5] = cur_l[5]
+
+            # The pick leaves the tool in the orientation of the target, so turning the wrist by 180 degrees
+            # turns the tool about its own z axis. The flipped orientation follows from the target without reading the robot state back.
+            with self.batch() as script:
+                script.rotate_wrist(radians(180), 0.6, 0.6)
+
+            flipped = m3d.Transform(target)
+            flipped.orient.rotate_zt(pi)
+            target[3:6] = list(flipped.orient.rotation_vector)
             
             gripper_controller.place(place_goal = target, approach_axis = approach_axis)
             self.home(home)
 
         except Exception as er:
             print(er)
-        finally:
-            gripper_controller.disconnect_gripper()
+            self._release_tools()
 
     def robotiq_screwdriver_transfer(self, home:list = None, source: list = None, target: list = None, source_approach_axis:str = None, target_approach_axis:str = None, source_approach_distance: float = None, target_approach_distance: float = None) -> None:
         '''
@@ -324,13 +513,19 @@ class UR():
 
         self.home(home)
 
+        from ur_tools import ScrewdriverController
+
+        sr = None
         try:
             sr = ScrewdriverController(hostname = self.hostname, ur = self.ur_connection, ur_dashboard = self.ur_dashboard)
             sr.screwdriver.activate_screwdriver()
             sr.transfer(source=source, target=target, source_approach_axis=source_approach_axis, target_approach_axis = target_approach_axis, source_approach_dist=source_approach_distance, target_approach_dist=target_approach_distance)
-            sr.screwdriver.disconnect()
         except Exception as err:
             print(err)
+        finally:
+            # Disconnect exactly once, also when the transfer failed
+            if sr is not None:
+                sr.screwdriver.disconnect()
         
         self.home(home)
 
@@ -342,16 +537,14 @@ class UR():
             raise Exception("Please provide both the source and target loactions to make a transfer")
         
         try:
-            pipette = TricontinentPipetteController(hostname = self.hostname, ur = self.ur_connection, pipette_ip=self.hostname)
-            pipette.connect_pipette()
+            pipette = self._get_pipette()
             pipette.pick_tip(tip_loc=tip_loc)
             self.home(home)
             pipette.transfer_sample(home = home, sample_aspirate=source, sample_dispense=target, vol = volume)
             pipette.eject_tip(eject_tip_loc=tip_trash,approach_axis="y")
-            pipette.disconnect_pipette()
-            print("Disconnecting from the pipette")
         except Exception as err:
             print(err)
+            self._release_tools()
         finally:
 
             # self.home(home)
@@ -359,6 +552,7 @@ class UR():
    
     def run_droplet(self, home, tip_loc, sample_loc, droplet_loc, tip_trash):
         """Create droplet"""
+        from ur_tools import OTPipetteController
 
         pipette = OTPipetteController(ur_connection = self.ur_connection, IP = self.hostname)
         pipette.connect_pipette()
@@ -375,9 +569,19 @@ class UR():
         pipette.disconnect_pipette()
         self.ur_connection.set_tool_communication
 
-    def run_urp_program(self, transfer_file_path:str = None, program_name: str = None):
+    def _is_urp_running(self) -> bool:
+        """
+        Description: Asks the dashboard whether a URP program is running. If the dashboard does not answer,
+                     the program flag of the secondary interface is used instead.
+        """
+        running = self.ur_dashboard.is_program_running()
+        if running is None:
+            running = self.ur_connection.is_program_running()
+        return running
+
+    def run_urp_program(self, transfer_file_path:str = None, program_name: str = None, timeout: float = 3600):
 
-        """Transfers the urp programs onto the polyscope and initiates them"""
+        """Transfers the urp programs onto the polyscope and initiates them. Raises a RobotException if the program is still running after the timeout"""
         if not program_name:
             raise ValueError("Provide program name!")
         
@@ -385,27 +589,34 @@ class UR():
 
         if transfer_file_path:
             self.ur_dashboard.transfer_program(local_path = transfer_file_path, ur_path = ur_program_path)
-            sleep(2)
 
-        self.ur_dashboard.load_program(program_path = ur_program_path)
-        sleep(2)
-        self.ur_dashboard.run_program()
-        sleep(5)
+        # The dashboard only replies once a command was carried out, so the replies replace fixed waits
+        output = self.ur_dashboard.load_program(program_path = ur_program_path)
+        if not output or not output.startswith("Loading program"):
+            raise Exception("Failed to load the URP program: " + str(output))
+        output = self.ur_dashboard.run_program()
+        if not output or not output.startswith("Starting program"):
+            raise Exception("Failed to start the URP program: " + str(output))
+
+        # The play reply can arrive before the program state changes, wait until it is reported as running
+        start_time = time()
+        while not self._is_urp_running() and time() - start_time < 5:
+            sleep(0.05)
         
         print("Running the URP program: ", program_name)
-        time_elapsed = 0
+        start_time = time()
         program_err = ""
         
-        program_status = "BUSY"
-        ready_status_count = 0
-        while program_status == "BUSY":
-            if self.get_movement_state() == "READY":
-                ready_status_count += 1
-                if ready_status_count >=6:
-                    program_status = "READY"
-            else:
-                ready_status_count = 0
-            sleep(3)
+        # Block on the state packets of the secondary interface until the program flag drops,
+        # then let the dashboard, which is authoritative for URPs, confirm that the program really stopped
+        while True:
+            remaining = timeout - (time() - start_time)
+            if remaining <= 0 or not self._wait_until_idle(timeout = remaining):
+                raise RobotException("URP program {} did not finish within {} s".format(program_name, timeout))
+            if not self._is_urp_running():
+                break
+            self.ur_connection.secmon.wait()
+        time_elapsed = round(time() - start_time)
 
         program_log = {"output_code":"0", "output_msg": "Successfully finished " + program_name, "output_log": "seconds_elapsed:" + str(time_elapsed)}
 
@@ -473,7 +684,7 @@ if __name__ == "__main__":
     robot.gripper_screw_transfer(home=home,screwdriver_loc=hex_key,screw_loc=cell_screw2,target=assembly_above,gripper_open=120,gripper_close=200,screw_time=10)
     robot.gripper_transfer(home = home, source = assembly_deck, target = cell_holder, source_approach_axis="y", target_approach_axis="z", gripper_open = 190, gripper_close = 240)
     robot.place_tool(home, handE_loc)
-    robot.ur.disconnect_ur()
+    robot.close()
     
 
 
@@ -1,14 +1,29 @@
-from .gripper_controller import FingerGripperController, VacuumGripperController
-from .ot_pipette_controller import OTPipetteController
-from .tricontinent_pipette_controller import TricontinentPipetteController
-from .wm_tool_changer_controller import WMToolChangerController
-from .ati_tool_changer_controller import ATIToolChangerController
-from .screwdriver_controller import ScrewdriverController
-from .camera_controller import CameraController
-from .urp_generator import URPGenerator
-from .robotiq_gripper_driver import RobotiqGripper
-from .robotiq_screwdriver_driver import RobotiqScrewdriver
-from .pipette_driver import PipetteDriver
-from .interpreter_socket import InterpreterSocket
+from importlib import import_module
 
+# The controllers pull in heavy dependencies (EPICS, torch, ultralytics, pyrealsense2), so each one is only imported on first access
+_SUBMODULES = {
+    "FingerGripperController": ".gripper_controller",
+    "VacuumGripperController": ".gripper_controller",
+    "OTPipetteController": ".ot_pipette_controller",
+    "TricontinentPipetteController": ".tricontinent_pipette_controller",
+    "WMToolChangerController": ".wm_tool_changer_controller",
+    "ATIToolChangerController": ".ati_tool_changer_controller",
+    "ScrewdriverController": ".screwdriver_controller",
+    "CameraController": ".camera_controller",
+    "URPGenerator": ".urp_generator",
+    "RobotiqGripper": ".robotiq_gripper_driver",
+    "get_shared_gripper": ".robotiq_gripper_driver",
+    "release_shared_gripper": ".robotiq_gripper_driver",
+    "RobotiqScrewdriver": ".robotiq_screwdriver_driver",
+    "PipetteDriver": ".pipette_driver",
+    "InterpreterSocket": ".interpreter_socket",
+}
 
+__all__ = list(_SUBMODULES)
+
+def __getattr__(name):
+    if name not in _SUBMODULES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(import_module(_SUBMODULES[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -1,3 +1,5 @@
+import os
+import logging
 from time import sleep, time
 from copy import deepcopy
 from typing import Optional, Tuple, List
@@ -12,9 +14,14 @@ from torchvision.transforms import functional as F
 from ultralytics import YOLO
 import numpy as np
 
-# from robotiq_gripper_driver import RobotiqGripper
+from .robotiq_gripper_driver import get_shared_gripper, release_shared_gripper
+from .frame_uploader import FrameUploader
 from urx import Robot
 
+log = logging.getLogger(__name__)
+
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
 
 class CameraController:
     """
@@ -23,7 +30,7 @@ class CameraController:
     a robot trajectory to pick up the objects based on distance and object reference frame information obtained from the camera.
     """
 
-    def __init__(self,  hostname: str = None, socket_timeout: float = 2.0, ur_connection: Optional[Robot] = None, target_object: Optional[str]= None) -> None:
+    def __init__(self,  hostname: str = None, socket_timeout: float = 2.0, ur_connection: Optional[Robot] = None, target_object: Optional[str]= None, debug_draw: bool = False) -> None:
         """ß
         Constructor for the CameraController class.
 
@@ -31,6 +38,7 @@ class CameraController:
             hostname (str): The IP address of the robot.
             ur_connection (Robot): The connection to the robot (urx.Robot instance), defaults to None.
             target_object (str): The target object for YOLO model, defaults to None.
+            debug_draw (bool): Draws the detections onto the captured images, defaults to False.
 
         Raises:
             ValueError: Raised when ur_connection or target_object is not provided.
@@ -45,8 +53,14 @@ class CameraController:
         self.target_object = target_object.lower()
         self.model = None
         self.object_distance = 0
+        self.debug_draw = debug_draw
+        self.debug_image = None # Last frame with the detection drawn on it, only kept with debug_draw
         self.object_reference_frame = None
-        self.gripper = RobotiqGripper()
+        self.gripper = None
+        self._frame_uploader = FrameUploader(FRAME_HEIGHT, FRAME_WIDTH)
+        # (height, width) of the model input and the largest batch, both set by load_yolo_model
+        self.input_shape = (FRAME_HEIGHT, FRAME_WIDTH)
+        self.batch_size = 1
 
         self.MOVE_ACC = 1.0
         self.MOVE_VEL = 1.0
@@ -54,6 +68,8 @@ class CameraController:
         self.CLASS_NAMES = ['deepwellplates', 'tipboxes', 'hammers', 'wellplates', 'wellplate_lids']
 
         self._validate_target_object()
+        # Detections carry integer class ids, so the target name is resolved to its id once here
+        self.target_cls_id = self.CLASS_NAMES.index(self.target_object)
         self._connect_to_gripper(hostname)
 
     def _validate_target_object(self):
@@ -61,10 +77,19 @@ class CameraController:
             raise ValueError(f"Target object category '{self.target_object}' doesn't exist in the trained model class list")
 
     def _connect_to_gripper(self, robot_ip: str):
-        print('Connecting to gripper...')
-        self.gripper.connect(robot_ip, 63352)
-        self.gripper.activate()
-        self.gripper.move_and_wait_for_pos(0, 150, 0)
+        log.info('Connecting to gripper...')
+        # Shares the connection with FingerGripperController, an already active gripper is not activated and opened again
+        self.gripper_host = robot_ip
+        self.gripper = get_shared_gripper(robot_ip, 63352)
+        if not self.gripper.is_active():
+            self.gripper.activate()
+            self.gripper.move_and_wait_for_pos(0, 150, 0)
+
+    def disconnect_gripper(self) -> None:
+        """Gives up the hold on the shared gripper connection, which is closed once no other controller uses it"""
+        if self.gripper is not None:
+            self.gripper = None
+            release_shared_gripper(self.gripper_host, 63352)
 
     def start_camera_stream(self) -> None:
         """Start the Intel realsense camera pipeline"""
@@ -72,12 +97,19 @@ class CameraController:
         try:
             self.pipeline = realsense.pipeline()
             config = realsense.config()
-            config.enable_stream(realsense.stream.color, 640, 480, realsense.format.rgb8, 30)
-            config.enable_stream(realsense.stream.depth, 640, 480, realsense.format.z16, 30)
-            self.pipeline.start(config)
+            # The camera delivers the color frames in OpenCV's BGR order, so capture_image needs no conversion
+            config.enable_stream(realsense.stream.color, FRAME_WIDTH, FRAME_HEIGHT, realsense.format.bgr8, 30)
+            config.enable_stream(realsense.stream.depth, FRAME_WIDTH, FRAME_HEIGHT, realsense.format.z16, 30)
+            # The SDK delivers frames on its own thread into a queue that only holds the newest frame set,
+            # so capture keeps running while a frame is being processed and stale frames are dropped
+            self.frame_queue = realsense.frame_queue(1, keep_frames=False)
+            profile = self.pipeline.start(config, self.frame_queue)
+            # The depth intrinsics are fixed for the lifetime of the stream, so they are read once here
+            depth_intrin = profile.get_stream(realsense.stream.depth).as_video_stream_profile().get_intrinsics()
+            self.fx, self.fy, self.ppx, self.ppy = depth_intrin.fx, depth_intrin.fy, depth_intrin.ppx, depth_intrin.ppy
         except realsense.error as e:
-            print(f"RealSense error {e.get_failed_function()}: {e.get_failed_args()}")
-            print(f"{e.get_description()}")    
+            log.error("RealSense error %s: %s", e.get_failed_function(), e.get_failed_args())
+            log.error("%s", e.get_description())    
 
     def capture_image(self) -> Tuple[np.array, 'realsense.frame', 'realsense.frame']:
         """
@@ -86,25 +118,195 @@ class CameraController:
         Returns:
             Tuple[np.array, 'realsense.frame', 'realsense.frame']: The captured image and the color and depth frames.
         """
-        frames = self.pipeline.wait_for_frames()
+        frames = self.frame_queue.wait_for_frame().as_frameset()
         color_frame = frames.get_color_frame()
         depth_frame = frames.get_depth_frame()
         img = np.asanyarray(color_frame.get_data())
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-        img = cv2.resize(img, (640, 480))
 
         return img, color_frame, depth_frame
 
-    def load_yolo_model(self, model_path: Optional[str] = None):
+    def load_yolo_model(self, model_path: Optional[str] = None, calibration_data: Optional[str] = None, imgsz: Optional[int] = None, batch_size: int = 4):
         """
         Loads the trained YOLO model.
 
+        On a CUDA host the model is exported once to a TensorRT engine next to the model file, INT8 when calibration data
+        is given and FP16 otherwise, and the engine is loaded from then on. If the export fails the PyTorch model runs in FP16.
+        Hosts without CUDA run an OpenVINO export of the model, quantized to INT8 when calibration data is given.
+
         Args:
             model_path (Optional[str]): Path to the model file, defaults to None.
+            calibration_data (Optional[str]): Path to the dataset YAML with the INT8 calibration frames
+                                              (see save_calibration_frames), defaults to None.
+            imgsz (Optional[int]): Width the frames are downscaled to before inference, a multiple of 32. Centering the gripper
+                                   only needs the box center, so e.g. 320 runs about 4x faster. Defaults to None (full frame).
+            batch_size (int): Largest number of frames get_object_xy runs in one inference. Exports accept any batch
+                              up to this size, defaults to 4.
         """
         model_file_path = model_path if model_path else "best.pt"
-        # Load the trained YOLO model
-        self.model = YOLO(model_file_path)
+        if imgsz:
+            # Keep the aspect ratio of the camera frames, rounded to the model stride
+            self.input_shape = (max(32, round(imgsz * FRAME_HEIGHT / FRAME_WIDTH / 32) * 32), imgsz)
+        else:
+            self.input_shape = (FRAME_HEIGHT, FRAME_WIDTH)
+        self.batch_size = batch_size
+        # Exports are built for a fixed input size, batch range and precision, so each combination gets its own file name
+        size_suffix = (f"_{imgsz}" if imgsz else "") + f"_b{batch_size}"
+        precision = "int8" if calibration_data else "fp16"
+        engine_file_path = os.path.splitext(model_file_path)[0] + size_suffix + f"_{precision}.engine"
+
+        if not torch.cuda.is_available():
+            openvino_model_path = self._export_openvino_model(model_file_path, calibration_data, self.input_shape, batch_size, size_suffix)
+            self.model = YOLO(openvino_model_path, task="detect") if openvino_model_path else YOLO(model_file_path)
+            # ultralytics letterboxes numpy frames to imgsz and maps the boxes back to frame pixels itself
+            self.model.overrides.update(imgsz=self.input_shape)
+            self._warmup()
+            return
+
+        use_engine = os.path.exists(engine_file_path) or self._export_engine(model_file_path, calibration_data, self.input_shape, batch_size, engine_file_path)
+        if use_engine:
+            self.model = YOLO(engine_file_path, task="detect")
+        else:
+            # Load the trained YOLO model
+            self.model = YOLO(model_file_path)
+
+        # Without an engine the model at least runs in half precision on the GPU. Setting the predictor
+        # overrides keeps ultralytics from casting the weights back to FP32 when it builds its backend
+        self.model.overrides.update(device=0, half=True, imgsz=self.input_shape)
+        if not use_engine: # TensorRT engines are compiled already
+            self._compile_model()
+        self._warmup()
+
+    def _warmup(self, runs: int = 2) -> None:
+        """
+        Runs blank frames through the model, so the predictor setup, CUDA context and kernel autotuning,
+        TensorRT execution context allocation or TorchInductor compilation happen here and not on the first real frame.
+        Both the single frame and the batched shape are run, as each one is set up separately.
+
+        Args:
+            runs (int): Number of times each shape is run, defaults to 2.
+        """
+        dummy = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+        inputs = [dummy] if self.batch_size == 1 else [dummy, [dummy] * self.batch_size]
+        with torch.inference_mode():
+            for _ in range(runs):
+                for frames in inputs:
+                    self.model(self._to_model_input(frames), verbose=False)
+
+    def _compile_model(self) -> None:
+        """
+        Compiles the PyTorch network with TorchInductor, using CUDA graphs for the repeated same shape frames.
+        The predictor is only built by the first inference, so a blank frame runs before the network is swapped.
+        """
+        self._warmup(runs=1)
+        backend = self.model.predictor.model
+        network = backend.model
+        try:
+            backend.model = torch.compile(network, mode="reduce-overhead")
+            self._warmup(runs=1)
+        except Exception as err:
+            log.warning("Model compilation failed, using the eager model: %s", err)
+            backend.model = network
+
+    @staticmethod
+    def _export_openvino_model(model_file_path: str, calibration_data: Optional[str], input_shape: Tuple[int, int], batch_size: int, size_suffix: str) -> Optional[str]:
+        """
+        Exports the model once to OpenVINO IR for CPU inference, quantized to INT8 when calibration data is given.
+        The batch dimension is dynamic, so single frames and batches of up to batch_size frames both run.
+        Later calls reuse the exported model directory next to the model file.
+
+        Returns:
+            Optional[str]: Path of the exported model directory, or None if the export failed.
+        """
+        suffix = "_int8_openvino_model" if calibration_data else "_openvino_model"
+        openvino_model_path = os.path.splitext(model_file_path)[0] + size_suffix + suffix
+        if os.path.isdir(openvino_model_path):
+            return openvino_model_path
+        try:
+            if calibration_data:
+                exported_path = YOLO(model_file_path).export(format="openvino", int8=True, data=calibration_data, imgsz=input_shape, dynamic=True, batch=batch_size)
+            else:
+                exported_path = YOLO(model_file_path).export(format="openvino", imgsz=input_shape, dynamic=True, batch=batch_size)
+        except Exception as err:
+            log.warning("OpenVINO export failed, using the PyTorch model: %s", err)
+            return None
+        if exported_path != openvino_model_path:
+            os.replace(exported_path, openvino_model_path)
+        return openvino_model_path
+
+    @staticmethod
+    def _export_engine(model_file_path: str, calibration_data: Optional[str], input_shape: Tuple[int, int], batch_size: int, engine_file_path: str) -> Optional[str]:
+        """
+        Builds a TensorRT engine for the model input size, INT8 calibrated on the given dataset, or FP16 without calibration data.
+        The engine has a dynamic batch dimension, so single frames and batches of up to batch_size frames both run.
+
+        Returns:
+            Optional[str]: Path of the exported engine, or None if the export failed.
+        """
+        try:
+            if calibration_data:
+                exported_path = YOLO(model_file_path).export(format="engine", int8=True, data=calibration_data, imgsz=input_shape, dynamic=True, batch=batch_size, device=0)
+            else:
+                exported_path = YOLO(model_file_path).export(format="engine", half=True, imgsz=input_shape, dynamic=True, batch=batch_size, device=0)
+        except Exception as err:
+            log.warning("TensorRT export failed, using the PyTorch model: %s", err)
+            return None
+        if exported_path != engine_file_path:
+            os.replace(exported_path, engine_file_path)
+        return engine_file_path
+
+    def save_calibration_frames(self, output_dir: str, frame_count: int = 300) -> str:
+        """
+        Saves representative camera frames and a dataset YAML that can be used as INT8 calibration data.
+
+        Args:
+            output_dir (str): Directory to write the frames and the dataset YAML into.
+            frame_count (int): Number of frames to capture, defaults to 300.
+
+        Returns:
+            str: Path of the dataset YAML.
+        """
+        image_dir = os.path.join(output_dir, "images")
+        os.makedirs(image_dir, exist_ok=True)
+        for i in range(frame_count):
+            img, _, _ = self.capture_image()
+            cv2.imwrite(os.path.join(image_dir, f"frame_{i:04d}.jpg"), img)
+
+        data_file_path = os.path.join(output_dir, "calibration.yaml")
+        with open(data_file_path, "w") as data_file:
+            data_file.write(f"path: {os.path.abspath(output_dir)}\ntrain: images\nval: images\n")
+            data_file.write("names:\n" + "".join(f"  {i}: {name}\n" for i, name in enumerate(self.CLASS_NAMES)))
+
+        return data_file_path
+
+    def _to_model_input(self, imgs):
+        """
+        Uploads BGR frames to the GPU and converts them there to the RGB NCHW tensor in [0, 1] that ultralytics
+        takes as is, instead of running its own numpy preprocessing. CPU hosts get the frames unchanged.
+
+        Args:
+            imgs (Union[np.array, List[np.array]]): A frame or a list of frames.
+        """
+        if not torch.cuda.is_available():
+            return imgs
+
+        batch = self._frame_uploader.to_model_input(imgs)
+        if self.input_shape != (FRAME_HEIGHT, FRAME_WIDTH):
+            batch = torch.nn.functional.interpolate(batch, size=self.input_shape, mode="bilinear", align_corners=False)
+        return batch
+
+    def _frame_xyxy(self, boxes):
+        """
+        Returns the box corners in camera frame pixels. Boxes predicted from a downscaled GPU tensor are in model input
+        pixels, since ultralytics only maps the boxes of numpy frames back to the original size.
+
+        Args:
+            boxes (Boxes): The boxes of one prediction.
+        """
+        xyxy = boxes.xyxy
+        if torch.cuda.is_available() and self.input_shape != (FRAME_HEIGHT, FRAME_WIDTH):
+            height, width = self.input_shape
+            xyxy = xyxy * xyxy.new_tensor([FRAME_WIDTH / width, FRAME_HEIGHT / height] * 2)
+        return xyxy
 
     def _get_object_predictions(self, img: np.array) -> Tuple[list, list]:
         """
@@ -117,9 +319,12 @@ class CameraController:
         Returns:
             Tuple[list, list]: A tuple containing a list of detected boxes and their corresponding classes.
         """
-        prediction = self.model(img)[0]
+        # One inference per frame, the classes come from the same result as the boxes.
+        # verbose=False skips ultralytics' per call console logging, which is costly in the polling loops
+        with torch.inference_mode():
+            prediction = self.model(self._to_model_input(img), verbose=False)[0]
         boxes = prediction.boxes
-        classes = prediction.cls
+        classes = boxes.cls
 
         return boxes, classes
     
@@ -149,50 +354,62 @@ class CameraController:
             Optional[Tuple[int, int]]: The x and y coordinates of the first object's center if detected, otherwise None.
         """
         if len(boxes) > 0:
-            xmin, ymin, xmax, ymax = boxes[0].xyxy[0]
+            xmin, ymin, xmax, ymax = self._frame_xyxy(boxes)[0]
             center_x = int((xmin + xmax) / 2)
             center_y = int((ymin + ymax) / 2)
             return center_x, center_y
         else:
             return None
         
-    def get_object_xy(self, timeout = 10) -> Optional[Tuple[int, int]]:
+    def get_object_xy(self, timeout = 10, batch_size: Optional[int] = None) -> Optional[Tuple[int, int]]:
         """
         Aligns the robot arm to the object's center until the center is detected.
         
         Args:
             timeout (int): The maximum amount of time (in seconds) to try aligning the robot arm.
+            batch_size (Optional[int]): Number of frames that are run through the model in one batched inference, at most
+                                        the batch size the model was loaded with. Defaults to None (the loaded batch size).
 
         Returns:
             Optional[Tuple[int, int]]: The x and y pixel coordinates of the object's center if detected, otherwise None.
         """
+        batch_size = batch_size if batch_size else self.batch_size
         object_xy = None
         start_time = time()
         while object_xy is None and time() - start_time < timeout:
-            img, color_frame, depth_frame = self.capture_image()
-
-            if not color_frame or not depth_frame or not img:
-                return None
-
-            boxes, classes = self._get_object_predictions(img)
-            object_xy = self._calculate_object_xy(boxes)
+            imgs = []
+            for _ in range(batch_size):
+                img, color_frame, depth_frame = self.capture_image()
+
+                if not color_frame or not depth_frame or img is None:
+                    return None
+                imgs.append(img)
+
+            # A batched inference keeps the GPU busy with several frames at once instead of one frame per camera wait.
+            # Scan from the newest frame so the returned center is the most recent one
+            with torch.inference_mode():
+                predictions = self.model(self._to_model_input(imgs), verbose=False)
+            for prediction in reversed(predictions):
+                object_xy = self._calculate_object_xy(prediction.boxes)
+                if object_xy is not None:
+                    break
 
         return object_xy
         
-    def _calculate_object_reference_frame(self, depth_frame: 'realsense.frame', center_x: int, center_y: int):
+    def _calculate_object_reference_frame(self, center_x: int, center_y: int):
         """
-        Get the object reference frame from the depth frame and center of the bounding box.
+        Get the object reference frame from the object distance and center of the bounding box.
 
         Args:
-            depth_frame (frame): Depth frame of the image.
             center_x (int): X coordinate of the object center.
             center_y (int): Y coordinate of the object center.
         """
 
-        # Get the intrinsic parameters of the depth frame
-        depth_intrin = depth_frame.profile.as_video_stream_profile().intrinsics
-        # Use the depth value and the center of the bounding box to get the 3D coordinates of the object
-        self.object_reference_frame = realsense.rs2_deproject_pixel_to_point(depth_intrin, [center_x, center_y], self.object_distance)
+        # Use the depth value and the center of the bounding box to get the 3D coordinates of the object.
+        # This is the pinhole deprojection rs2_deproject_pixel_to_point does for the undistorted D400 depth stream
+        self.object_reference_frame = [(center_x - self.ppx) / self.fx * self.object_distance,
+                                       (center_y - self.ppy) / self.fy * self.object_distance,
+                                       self.object_distance]
     
     @staticmethod
     def _calculate_box_center(xmin: float, xmax: float, ymin: float, ymax: float) -> Tuple[int, int]:
@@ -202,8 +419,8 @@ class CameraController:
     def _draw_on_image(img: np.array, xmin: float, ymin: float, xmax: float, ymax: float, center_x: int, center_y: int, distance: float) -> None:
         cv2.rectangle(img, (int(xmin), int(ymin)), (int(xmax), int(ymax)), (0, 255, 0), 2)
         cv2.putText(img, f"{distance:.2f}m", (int(xmin), int(ymin) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-        cv2.circle(img, (center_x, center_y), 5, (0, 0, 255), -1)
-        cv2.circle(img, (640/2, 480/2), 5, (0, 0, 255), -1)
+        cv2.circle(img, (int(center_x), int(center_y)), 5, (0, 0, 255), -1)
+        cv2.circle(img, (FRAME_WIDTH // 2, FRAME_HEIGHT // 2), 5, (0, 0, 255), -1)
 
     def move_to_object(self, move_z: Optional[float] = 0.0):
         """Method to move the robot arm to the object"""
@@ -214,7 +431,7 @@ class CameraController:
         trans_z = self.object_reference_frame[2]
 
         # Print out the object's 3D coordinates
-        print("Object XYZ: " + str(self.object_reference_frame))
+        log.debug("Object XYZ: %s", self.object_reference_frame)
 
         if trans_z != 0:
             # Move the robot's tool (e.g. a gripper) to the object
@@ -234,17 +451,22 @@ class CameraController:
         """
 
         boxes, classes = self._get_object_predictions(img)
-        for (xmin, ymin, xmax, ymax), cls in zip(boxes.xyxy, classes):
-            if cls == self.target_object:
-                center_x, center_y = self._calculate_box_center(xmin, xmax, ymin, ymax)
-                self.object_distance = depth_frame.get_distance(center_x, center_y)
+        # Select the first box of the target class with one comparison on the device, then copy back only its corners
+        matches = (classes == self.target_cls_id).nonzero()
+        if len(matches) == 0:
+            raise Exception(f'Target object {self.target_object} not found in the frame.')
 
-                self._draw_on_image(img, xmin, ymin, xmax, ymax, center_x, center_y, self.object_distance)
+        xmin, ymin, xmax, ymax = self._frame_xyxy(boxes)[matches[0, 0]].tolist()
+        center_x, center_y = self._calculate_box_center(xmin, xmax, ymin, ymax)
+        depth_img = np.asanyarray(depth_frame.get_data())
+        self.object_distance = float(depth_img[center_y, center_x]) * depth_frame.get_units()
 
-                self._calculate_object_reference_frame(depth_frame, center_x, center_y)
-                break
-        else:
-            raise Exception(f'Target object {self.target_object} not found in the frame.')
+        if self.debug_draw:
+            # The frame is a view of the librealsense buffer, which the SDK may reuse, so the overlay goes on a copy
+            self.debug_image = img.copy()
+            self._draw_on_image(self.debug_image, xmin, ymin, xmax, ymax, center_x, center_y, self.object_distance)
+
+        self._calculate_object_reference_frame(center_x, center_y)
 
     def calculate_object_alignment(self) -> None:
         """
@@ -260,7 +482,7 @@ class CameraController:
 
         # Capture image and get color and depth frames
         img, color_frame, depth_frame = self.capture_image()
-        if not color_frame or not depth_frame or not img:
+        if not color_frame or not depth_frame or img is None:
             raise ValueError("Could not capture image or retrieve color/depth frames")
 
         self._detect_object_coordinates(img, depth_frame)
@@ -293,7 +515,7 @@ class CameraController:
         angle = self.ur_connection.getl()[4]
 
         adjacent_length = cos(degrees(angle)) * trans_z
-        print(f'Adjacent length: {adjacent_length}')
+        log.debug('Adjacent length: %s', adjacent_length)
 
         return abs(adjacent_length)
 
@@ -304,7 +526,7 @@ class CameraController:
        
         current_orientation = self.ur_connection.get_orientation()
         euler_angles = current_orientation.to_euler(encoding="xyz")
-        print(euler_angles)
+        log.debug('Gripper orientation: %s', euler_angles)
         move_rx = (3.14 - abs(euler_angles[0]))
 
         if euler_angles[1] < 0: 
@@ -355,12 +577,14 @@ class CameraController:
             rotated_img = cv2.warpAffine(img, rotation_matrix, (img.shape[1], img.shape[0]))
             
             boxes, classes = self._get_object_predictions(rotated_img)
-            for i, cls in enumerate(classes):
-                if cls != self.target_object:
-                    continue
-                frame_areas = self.find_frame_areas([boxes[i]])
-
-                current_frame_area = min(frame_areas)
+            # Copy the boxes and class ids to the host once per frame and compare the ids to the target class id,
+            # instead of comparing each class tensor to the target name
+            xyxy = self._frame_xyxy(boxes).cpu().numpy()
+            cls = classes.cpu().numpy().astype(int)
+            hits = np.where(cls == self.target_cls_id)[0]
+            frame_areas = (xyxy[hits, 2] - xyxy[hits, 0]) * (xyxy[hits, 3] - xyxy[hits, 1])
+
+            for current_frame_area in frame_areas:
                 if current_frame_area < smallest_frame_area:
                     smallest_frame_area = current_frame_area
                     robot_rotation_angle = image_rotation_angle
@@ -381,13 +605,13 @@ class CameraController:
 
             if object_xy:
                 self.calculate_object_alignment()
-                print(f"OBJECT_POINT: {self.object_reference_frame}")
+                log.debug("OBJECT_POINT: %s", self.object_reference_frame)
                 self.move_to_object()
             else:
                 self.object_reference_frame = None
 
         if not self.object_reference_frame:
-            print("Object can't be found!")
+            log.warning("Object can't be found!")
             return
         
         sleep(4)
@@ -423,7 +647,7 @@ class CameraController:
 
             if object_xy:
                 self.calculate_object_alignment()
-                print(f"OBJECT_POINT: {self.object_reference_frame}")
+                log.debug("OBJECT_POINT: %s", self.object_reference_frame)
                 if self.object_reference_frame[2] > 0.31:
                     self.move_to_object(move_z=0.01)
                 elif self.object_reference_frame[2] < 0.31:
@@ -438,7 +662,7 @@ class CameraController:
                 self.object_reference_frame  = None
 
         if not self.object_reference_frame:
-            print("Object can't be found!")
+            log.warning("Object can't be found!")
             return
         
     def pick_conveyor_object(self):
@@ -468,7 +692,7 @@ class CameraController:
 
             num_failed_attempts += 1
             if num_failed_attempts > MAX_ATTEMPTS:
-                print("Failed to pick up object after multiple attempts.")
+                log.warning("Failed to pick up object after multiple attempts.")
                 break
 
     def _estimate_pickup_delay(self, object_point: Tuple[float, float, float]) -> float:
@@ -477,7 +701,7 @@ class CameraController:
         For simplicity, this example assumes a constant time delay. In a real application, you might want to calculate this based on the robot's current state and the target point.
         """
         robot_position = self.ur_connection.getl()
-        distance_to_target = ((robot_position[0]-object_point[0])**2 + (robot_position[1]-object_point[1])**2 + (robot_position[2]-object_point[2])**2)**0.5
+        distance_to_target = np.linalg.norm(np.subtract(robot_position[:3], object_point[:3]))
         time = distance_to_target / self.MOVE_VEL
         return time    
     
@@ -512,7 +736,7 @@ def main():
     controller = CameraController(robot_ip, ur_robot, target_object)
     
     # Load model and start streaming
-    controller.load_yolo_model('best.pt')  # replace with your model's path
+    controller.load_yolo_model('best.pt', imgsz=320)  # replace with your model's path
     controller.start_camera_stream()
 
     for i in range(6):
@@ -528,6 +752,7 @@ def main():
     controller.align_gripper()
     controller.pick_static_object()
     controller.pipeline.stop()
+    controller.disconnect_gripper()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
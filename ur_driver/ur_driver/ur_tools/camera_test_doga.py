@@ -1,4 +1,5 @@
 
+import os
 import cv2
 import pyrealsense2 as rs
 import time
@@ -11,10 +12,16 @@ from math import degrees
 from urx.robotiq_two_finger_gripper import Robotiq_Two_Finger_Gripper as gripper1
 import sys
 from robotiq_gripper_driver import RobotiqGripper
+from frame_uploader import FrameUploader
 # setting path
 from urx import Robot
 from transforms3d import euler, quaternions
 
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+
+_FRAME_UPLOADER = FrameUploader(FRAME_HEIGHT, FRAME_WIDTH)
+
 # Start the URX robot connection
 def connect_robot():
     robot = Robot("192.168.1.103")
@@ -30,10 +37,27 @@ def connect_robot():
 
     return robot, gripper
 
+def export_engine(model_file_path):
+    # One time build of a TensorRT engine specialized for the fixed camera frame size.
+    # The engine is written next to the .pt file and reused on every following start
+    try:
+        return YOLO(model_file_path).export(format='engine', imgsz=(FRAME_HEIGHT, FRAME_WIDTH), half=True, dynamic=False, device=0)
+    except Exception as err:
+        print("TensorRT export failed, using the PyTorch model: ", err)
+        return None
+
 def load_model():
     model_file_path = '/home/rpl/wei_ws/src/ur_module/ur_driver/scripts/best.pt'
-    # Load the trained YOLO model
-    model = YOLO(model_file_path)
+    engine_file_path = os.path.splitext(model_file_path)[0] + '.engine'
+    # Load the trained YOLO model, preferring the TensorRT engine on NVIDIA hosts
+    if torch.cuda.is_available() and (os.path.exists(engine_file_path) or export_engine(model_file_path)):
+        model = YOLO(engine_file_path, task='detect')
+    else:
+        model = YOLO(model_file_path)
+    if torch.cuda.is_available():
+        # Run every prediction on the GPU in half precision at the engine's input size. Setting the predictor
+        # overrides keeps ultralytics from casting the weights back to FP32 when it builds its backend
+        model.overrides.update(device=0, half=True, imgsz=(FRAME_HEIGHT, FRAME_WIDTH))
     # Set the desired objects to detect
     desired_objects = ['deepwellplates'] #, 'tipboxes', 'hammers', 'deepwellplates', 'wellplate_lids']  #list of known objects
     return model
@@ -41,93 +65,97 @@ def load_model():
 def start_streaming():
     pipeline = rs.pipeline()
     config = rs.config()
-    config.enable_stream(rs.stream.color, 640, 480, rs.format.rgb8, 30)  # Color stream configuration
-    config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 30)  # Depth stream configuration
-    profile = pipeline.start(config)
-    return pipeline
-
-def capture_image(pipeline):
+    config.enable_stream(rs.stream.color, FRAME_WIDTH, FRAME_HEIGHT, rs.format.bgr8, 30)  # Color stream configuration
+    config.enable_stream(rs.stream.depth, FRAME_WIDTH, FRAME_HEIGHT, rs.format.z16, 30)  # Depth stream configuration
+    # Frames are delivered into an SDK side queue that only holds the newest frame set, older ones are dropped
+    frame_queue = rs.frame_queue(1, keep_frames=False)
+    profile = pipeline.start(config, frame_queue)
+    # Depth frames are aligned to the color frame so that detection pixels index the depth image directly.
+    # The align block is reused for every frame, and since aligned depth shares the color geometry the color intrinsics apply
+    align = rs.align(rs.stream.color)
+    # Intrinsics and depth scale are fixed for the lifetime of the stream, read them once here
+    depth_intrin = profile.get_stream(rs.stream.color).as_video_stream_profile().get_intrinsics()
+    depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+    return pipeline, frame_queue, align, depth_intrin, depth_scale
+
+def frame_to_bgr(color_frame):
+    # The color stream is already delivered as BGR, view the frame data without copying it
+    return np.asanyarray(color_frame.get_data())
+
+def capture_image(frame_queue):
     # Capture a new image from the camera
-    frames = pipeline.wait_for_frames()
+    frames = frame_queue.wait_for_frame().as_frameset()
     color_frame = frames.get_color_frame()
-    img = np.asanyarray(color_frame.get_data())
-    img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
 
-    return img
+    return frame_to_bgr(color_frame)
 
 def get_object_center(boxes):
-    if len(boxes) > 0:
-        xmin, ymin, xmax, ymax = boxes[0].xyxy[0]
-        center_x = int((xmin + xmax) / 2)
-        center_y = int((ymin + ymax) / 2)
-        return center_x, center_y
-    else:
+    if len(boxes) == 0:
         return None
-
-def allign_object(pipeline, model):
+    # Compute the center where the boxes live and copy the two values back in one transfer
+    center = (boxes.xyxy[0, :2] + boxes.xyxy[0, 2:]) * 0.5
+    center_x, center_y = center.cpu().int().tolist()
+    return center_x, center_y
+
+def allign_object(frame_queue, align, model):
+    # Returns the object center together with the detections and frames it was found in,
+    # so that center_the_gripper can reuse them instead of running the model again
     object_center = None
     while object_center is None:
-        frames = pipeline.wait_for_frames()
+        frame = frame_queue.poll_for_frame()
+        if not frame:
+            time.sleep(0.001) # No new frame yet, yield briefly instead of blocking on the camera
+            continue
+        frames = align.process(frame.as_frameset())
         color_frame = frames.get_color_frame()
         depth_frame = frames.get_depth_frame()
 
         if not color_frame or not depth_frame:
-            return None
+            return None, None, None, None
 
-        img = np.asanyarray(color_frame.get_data())
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-        img = cv2.resize(img, (640, 480))
+        img = frame_to_bgr(color_frame) # Already FRAME_WIDTH x FRAME_HEIGHT, no resize needed
 
-        boxes = model(img)[0].boxes  # Perform object detection
+        boxes = model(_FRAME_UPLOADER.to_model_input(img))[0].boxes  # Perform object detection
         object_center = get_object_center(boxes)
         
-    return object_center
+    return object_center, boxes, img, depth_frame
 
-def center_the_gripper(robot, model, object_center, pipeline):
-    if object_center is None:
+def center_the_gripper(robot, boxes, img, depth_frame, depth_intrin, depth_scale):
+    # Uses the detections made by allign_object to compute object 3D coordinates
+    if boxes is None or len(boxes) == 0:
         return
 
-    # Get color and depth frames again to compute object 3D coordinates
-    frames = pipeline.wait_for_frames()
-    color_frame = frames.get_color_frame()
-    depth_frame = frames.get_depth_frame()
-
-    if not color_frame or not depth_frame:
-        return
-
-    img = np.asanyarray(color_frame.get_data())
-    img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-    img = cv2.resize(img, (640, 480))
-
-    boxes = model(img)[0].boxes  # Perform object detection
-
-    for (xmin, ymin, xmax, ymax), cls in zip(boxes.xyxy, boxes.cls):
-        depth_value = depth_frame.get_distance(int((xmin + xmax) / 2), int((ymin + ymax) / 2))
-        distance = depth_value
-        center_x = int((xmin + xmax) / 2)
-        center_y = int((ymin + ymax) / 2)
+    # Compute every box center and its distance at once instead of box by box
+    xyxy = boxes.xyxy.cpu().numpy()
+    centers_x = ((xyxy[:, 0] + xyxy[:, 2]) * 0.5).astype(np.int32)
+    centers_y = ((xyxy[:, 1] + xyxy[:, 3]) * 0.5).astype(np.int32)
+    depth_img = np.asanyarray(depth_frame.get_data())
+    distances = depth_img[centers_y, centers_x] * depth_scale
 
+    for (xmin, ymin, xmax, ymax), center_x, center_y, distance in zip(xyxy.astype(np.int32), centers_x, centers_y, distances):
         cv2.rectangle(img, (int(xmin), int(ymin)), (int(xmax), int(ymax)), (0, 255, 0), 2)
         cv2.putText(img, f"{distance:.2f}m", (int(xmin), int(ymin) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-        cv2.circle(img, (center_x, center_y), 5, (0, 0, 255), -1)
-        cv2.circle(img, (320, 240), 5, (0, 0, 255), -1)
+        cv2.circle(img, (int(center_x), int(center_y)), 5, (0, 0, 255), -1)
+    cv2.circle(img, (320, 240), 5, (0, 0, 255), -1)
 
-        # Obtain the x, y, and z coordinates of the center of the object
-        depth_intrin = depth_frame.profile.as_video_stream_profile().intrinsics
-        object_point = rs.rs2_deproject_pixel_to_point(depth_intrin, [center_x, center_y], depth_value)
+    # Target the first object with a valid depth reading, only its pixel needs to be deprojected
+    valid = np.flatnonzero(distances)
+    target = valid[0] if len(valid) else len(distances) - 1
 
-        trans_x = object_point[0]
-        trans_y = object_point[1]
-        trans_z = object_point[2]
+    # Obtain the x, y, and z coordinates of the center of the object
+    object_point = rs.rs2_deproject_pixel_to_point(depth_intrin, [int(centers_x[target]), int(centers_y[target])], float(distances[target]))
+
+    trans_x = object_point[0]
+    trans_y = object_point[1]
+    trans_z = object_point[2]
 
-        print("XYZ: " + str(object_point))
+    print("XYZ: " + str(object_point))
 
-        if trans_z != 0:
-            robot.translate_tool([-trans_x, -trans_y, 0], acc=0.5, vel=0.2)
-            break  # break after moving the robot over the first object
+    if trans_z != 0:
+        robot.translate_tool([-trans_x, -trans_y, 0], acc=0.5, vel=0.2) # move the robot over the first object
 
-        # time.sleep(5)             
-        # cv2.destroyAllWindows()
+    # time.sleep(5)             
+    # cv2.destroyAllWindows()
 
     return object_point
 
@@ -154,9 +182,9 @@ def get_adjacent_lenght(object_point, robot):
 def find_frame_areas(boxes):
     return [(box[0], box[1], box[2], box[3]) for box in boxes]
 
-def align_gripper(pipeline, model, robot):
+def align_gripper(frame_queue, model, robot):
 
-    img = capture_image(pipeline)
+    img = capture_image(frame_queue)
     # rotate the gripper so it's aligned with the object
     image_rotation_angle = 1
     robot_rotation_angle = 0  # initialize robot_rotation_angle to 0
@@ -165,7 +193,7 @@ def align_gripper(pipeline, model, robot):
         # Rotate the image
         rotation_matrix = cv2.getRotationMatrix2D((img.shape[1] // 2, img.shape[0] // 2), image_rotation_angle, 1.0)
         rotated_img = cv2.warpAffine(img, rotation_matrix, (img.shape[1], img.shape[0]))
-        boxes = model(rotated_img, conf=0.01)[0].boxes
+        boxes = model(_FRAME_UPLOADER.to_model_input(rotated_img), conf=0.01)[0].boxes
         frame_areas = find_frame_areas(boxes)
         
         current_frame_area = min(frame_areas)
@@ -192,13 +220,13 @@ def move_gripper_perpendicular(robot):
     current_orientation.rotate_yt(move_ry)
     robot.set_orientation(current_orientation,0.2,0.2)
 
-def pick_object(robot, pipeline, model, gripper):
+def pick_object(robot, frame_queue, align, model, gripper, depth_intrin, depth_scale):
 
     for i in range(6):
-        object_center = allign_object(pipeline, model)
+        object_center, boxes, img, depth_frame = allign_object(frame_queue, align, model)
 
         if object_center:
-            object_point = center_the_gripper(robot, model, object_center, pipeline)
+            object_point = center_the_gripper(robot, boxes, img, depth_frame, depth_intrin, depth_scale)
             print("OBJECT_POINT: " , object_point)
     time.sleep(4)
     robot.translate_tool([0.02,0.09,0],1,0.2)
@@ -221,19 +249,19 @@ def pick_object(robot, pipeline, model, gripper):
 def main():
     robot, gripper = connect_robot()
     model = load_model()
-    pipeline = start_streaming()
+    pipeline, frame_queue, align, depth_intrin, depth_scale = start_streaming()
 
     for i in range(6):
-        object_center = allign_object(pipeline, model)
+        object_center, boxes, img, depth_frame = allign_object(frame_queue, align, model)
 
         if object_center:
-            object_point = center_the_gripper(robot, model, object_center, pipeline)
+            object_point = center_the_gripper(robot, boxes, img, depth_frame, depth_intrin, depth_scale)
             print("OBJECT_POINT: " , object_point)
 
     move_over_object(object_point, robot)
     time.sleep(5)
 
-    pick_object(robot,pipeline,model, gripper)
+    pick_object(robot,frame_queue,align,model, gripper, depth_intrin, depth_scale)
     #     align_gripper(pipeline, model, robot)
     # for i in range(5):
     #     object_center = allign_object(pipeline, model)
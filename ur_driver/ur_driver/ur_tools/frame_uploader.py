@@ -0,0 +1,52 @@
+import torch
+
+
+class FrameUploader:
+    """
+    Uploads BGR camera frames to the GPU and converts them there to the RGB NCHW tensor in [0, 1] that ultralytics
+    takes as is, instead of running its own numpy preprocessing. The frames are staged in a pinned host buffer and
+    copied on a side stream, so the upload can overlap with GPU work that is already queued.
+    """
+
+    def __init__(self, height: int, width: int) -> None:
+        """
+        Args:
+            height (int): Height of the frames in pixels.
+            width (int): Width of the frames in pixels.
+        """
+        self.height = height
+        self.width = width
+        # Pinned host buffer and side stream, created on first use
+        self._pinned_frames = None
+        self._copy_stream = None
+
+    def to_model_input(self, imgs):
+        """
+        Converts a frame or a batch of frames to the model input. CPU hosts get the frames unchanged.
+
+        Args:
+            imgs (Union[np.array, List[np.array]]): A frame or a list of frames.
+        """
+        if not torch.cuda.is_available():
+            return imgs
+
+        frames = imgs if isinstance(imgs, list) else [imgs]
+        if self._pinned_frames is None or self._pinned_frames.shape[0] < len(frames):
+            self._pinned_frames = torch.empty((len(frames), self.height, self.width, 3), dtype=torch.uint8, pin_memory=True)
+            self._copy_stream = self._copy_stream or torch.cuda.Stream()
+
+        # The previous upload must be done before the pinned buffer is overwritten
+        self._copy_stream.synchronize()
+        pinned = self._pinned_frames[:len(frames)]
+        for pinned_frame, frame in zip(pinned.numpy(), frames):
+            pinned_frame[...] = frame
+        with torch.cuda.stream(self._copy_stream):
+            batch = pinned.to("cuda", non_blocking=True)
+        current_stream = torch.cuda.current_stream()
+        current_stream.wait_stream(self._copy_stream)
+        # The batch was allocated on the side stream but is read on the current one, without this the caching
+        # allocator could hand its memory to the next upload while inference still reads it
+        batch.record_stream(current_stream)
+
+        # BGR NHWC uint8 to RGB NCHW, converted on the GPU
+        return batch.permute(0, 3, 1, 2).flip(1).half().div_(255)
@@ -1,7 +1,12 @@
+import logging
 from time import sleep
-from copy import deepcopy
 
-from .robotiq_gripper_driver import RobotiqGripper
+from .robotiq_gripper_driver import get_shared_gripper, release_shared_gripper
+
+log = logging.getLogger(__name__)
+
+# Approach axis name to the pose index it offsets and the direction of the offset
+_AXIS_MAP = {"x": (0, 1), "-x": (0, -1), "y": (1, 1), "-y": (1, -1), "z": (2, 1), "-z": (2, -1)}
 
 class FingerGripperController():
     
@@ -16,6 +21,7 @@ class FingerGripperController():
         """
         self.host = hostname
         self.PORT = port
+        self.gripper = None
         
         if not ur:
             raise Exception("UR connection is not established")
@@ -37,48 +43,71 @@ class FingerGripperController():
         self.blend_radius_m = 0.001
         self.ref_frame = [0,0,0,0,0,0]
 
-    def connect_gripper(self):
+    def connect_gripper(self, reset_tool_communication: bool = True, activate: bool = True) -> bool:
         """
-        Connect to the gripper
+        Connect to the gripper. Returns True once the gripper is ready.
+        Resetting the tool communication between attempts sends a URScript program, which would abort a running motion,
+        so without reset_tool_communication only a single attempt is made.
+        Activation auto calibrates the gripper, opening and closing the fingers. Without activate an inactive gripper is
+        left alone and False is returned, so it can be activated later while the robot is still.
         """
-        for i in range(2):
+        # A previous connection of this controller is given up first, so the controller holds the shared gripper at most once
+        self._release_gripper()
+        for i in range(2 if reset_tool_communication else 1):
             try:
                 # GRIPPER SETUP:
-                self.gripper = RobotiqGripper()
-                print('Connecting to gripper...')
-                self.gripper.connect(hostname = self.host, port = self.PORT)
+                log.info('Connecting to gripper...')
+                self.gripper = get_shared_gripper(hostname = self.host, port = self.PORT)
                 
                 if self.gripper.is_active():
-                    print('Gripper already active')
+                    log.info('Gripper already active')
+                elif not activate:
+                    log.info('Gripper is not active, activation is left to a later connection')
+                    self._release_gripper()
+                    return False
                 else:
-                    print('Activating gripper...')
+                    log.info('Activating gripper...')
                     self.gripper.activate()
-                    print('Opening gripper...')
+                    log.info('Opening gripper...')
                     self.open_gripper()
             
             except Exception as err:
-                print("Gripper connection failed, try {}: {} ".format(i+1,err))
-                self.ur.set_tool_communication(baud_rate=115200,
-                                        parity=0,
-                                        stop_bits=1,
-                                        rx_idle_chars=1.5,
-                                        tx_idle_chars=3.5)       
-                sleep(4)
+                log.warning("Gripper connection failed, try %d: %s", i+1, err)
+                # Give up this controller's hold, the connection is only closed if no other controller uses it
+                self._release_gripper()
+                if reset_tool_communication:
+                    self.ur.set_tool_communication(baud_rate=115200,
+                                            parity=0,
+                                            stop_bits=1,
+                                            rx_idle_chars=1.5,
+                                            tx_idle_chars=3.5)       
+                    sleep(4)
 
             else:
-                print("Gripper is ready!")
+                log.info("Gripper is ready!")
+                return True
+
+        return False
 
     def disconnect_gripper(self):
         """
         Discconect from the gripper
         """
         try:
-            self.gripper.disconnect()
+            self._release_gripper()
         except Exception as err:
-            print("Gripper error: ", err)
+            log.error("Gripper error: %s", err)
 
         else:
-            print("Gripper connection is closed")
+            log.info("Gripper connection is closed")
+
+    def _release_gripper(self) -> None:
+        """
+        Gives up this controller's hold on the shared gripper connection
+        """
+        if self.gripper is not None:
+            self.gripper = None
+            release_shared_gripper(self.host, self.PORT)
 
     def home_robot(self, home:list = None) -> None:
         """
@@ -98,8 +127,8 @@ class FingerGripperController():
         if speed:
             self.gripper_speed = speed
 
+        # Returns once the fingers stopped, either at the position or on an object, so no extra settle time is needed
         self.gripper.move_and_wait_for_pos(self.gripper_open, self.gripper_speed, self.gripper_force)
-        sleep(0.5)
   
     def close_gripper(self, pose:float = None, speed:float = None, force:float = None) -> None:
         """Closes the gripper using pose, speed and force variables"""
@@ -110,49 +139,42 @@ class FingerGripperController():
         if speed:
             self.gripper_speed = speed
 
+        # Returns once the fingers stopped, either at the position or on an object, so no extra settle time is needed
         self.gripper.move_and_wait_for_pos(self.gripper_close, self.gripper_speed, self.gripper_force)
-        sleep(0.5)
         
+    @staticmethod
+    def _approach_pose(goal:list, approach_axis:str = None, approach_distance:float = None) -> list:
+        """Returns the pose the goal is approached from, offset along the approach axis"""
+        if not approach_distance:
+            approach_distance = 0.05
+
+        axis, direction = _AXIS_MAP[(approach_axis or "z").lower()]
+
+        above_goal = list(goal)
+        above_goal[axis] += approach_distance * direction
+        return above_goal
+
     def pick(self, pick_goal:list = None, approach_axis:str = None, approach_distance:float = None):
 
         '''Pick up from first goal position'''
 
         if not pick_goal:
             raise Exception("Please provide the source loaction")
-        
-        if not approach_distance:
-            approach_distance = 0.05
 
-        axis = None
-
-        if not approach_axis or approach_axis.lower() == "z":
-            axis = 2
-        elif approach_axis.lower() == "y":
-            axis = 1
-        elif approach_axis.lower() == "-y":
-            axis = 1
-            approach_distance = -approach_distance
-        elif approach_axis.lower() == "x":
-            axis = 0
-        elif approach_axis.lower() == "-x":
-            axis = 0
-            approach_distance = -approach_distance
-
-        above_goal = deepcopy(pick_goal)
-        above_goal[axis] += approach_distance
+        above_goal = self._approach_pose(pick_goal, approach_axis, approach_distance)
         
         self.open_gripper()
 
-        print('Moving to above goal position')
+        log.debug('Moving to above goal position')
         self.ur.movel(above_goal, self.acceleration, self.velocity)
 
-        print('Moving to goal position')
+        log.debug('Moving to goal position')
         self.ur.movel(pick_goal, self.acceleration, self.velocity)
 
-        print('Closing gripper')
+        log.debug('Closing gripper')
         self.close_gripper()
 
-        print('Moving back to above goal position')
+        log.debug('Moving back to above goal position')
         self.ur.movel(above_goal, self.acceleration, self.velocity)
 
 
@@ -161,47 +183,58 @@ class FingerGripperController():
         '''Place down at second goal position'''
         if not place_goal:
             raise Exception("Please provide the target loaction")
-        
-        if not approach_distance:
-            approach_distance = 0.05
-        
-        axis = None
-
-        if not approach_axis or approach_axis.lower() == "z":
-            axis = 2
-        elif approach_axis.lower() == "y":
-            axis = 1
-        elif approach_axis.lower() == "-y":
-            axis = 1
-            approach_distance = -approach_distance
-        elif approach_axis.lower() == "x":
-            axis = 0
-        elif approach_axis.lower() == "-x":
-            axis = 0
-            approach_distance = -approach_distance
-
-        above_goal = deepcopy(place_goal)
-        above_goal[axis] += approach_distance
-
-        print('Moving to above goal position')
+
+        above_goal = self._approach_pose(place_goal, approach_axis, approach_distance)
+
+        log.debug('Moving to above goal position')
         self.ur.movel(above_goal, self.acceleration, self.velocity)
 
-        print('Moving to goal position')
+        log.debug('Moving to goal position')
         self.ur.movel(place_goal, self.acceleration, self.velocity)
 
-        print('Opennig gripper')
+        log.debug('Opennig gripper')
         self.open_gripper()
 
-        print('Moving back to above goal position')
+        log.debug('Moving back to above goal position')
         self.ur.movel(above_goal, self.acceleration, self.velocity)
 
     def transfer(self, home:list = None, source:list = None, target:list = None, source_approach_axis:str = None, target_approach_axis:str = None, source_approach_distance: float = None, target_approach_distance: float = None) -> None:
-        """Handles the transfer request"""
-        self.pick(pick_goal = source, approach_axis = source_approach_axis, approach_distance = source_approach_distance)
-        print("Pick up completed")
-        self.home_robot(home=home)
-        self.place(place_goal = target, approach_axis = target_approach_axis, approach_distance = target_approach_distance)
-        print("Place completed")
+        """
+        Handles the transfer request.
+        The motions between the gripper actions run as blended paths, so the robot only comes to a stop where the gripper acts and at home.
+        """
+        if not source:
+            raise Exception("Please provide the source loaction")
+        if not target:
+            raise Exception("Please provide the target loaction")
+
+        source_above = self._approach_pose(source, source_approach_axis, source_approach_distance)
+        target_above = self._approach_pose(target, target_approach_axis, target_approach_distance)
+
+        self.open_gripper()
+
+        log.debug('Moving to source position')
+        self.ur.movels([source_above, source], self.acceleration, self.velocity, radius = self.blend_radius_m)
+
+        log.debug('Closing gripper')
+        self.close_gripper()
+        log.info("Pick up completed")
+
+        log.debug('Moving to target position')
+        if home:
+            # Homing is a joint move, which cannot be blended into the linear paths around it
+            self.ur.movel(source_above, self.acceleration, self.velocity)
+            self.home_robot(home=home)
+            self.ur.movels([target_above, target], self.acceleration, self.velocity, radius = self.blend_radius_m)
+        else:
+            self.ur.movels([source_above, target_above, target], self.acceleration, self.velocity, radius = self.blend_radius_m)
+
+        log.debug('Opennig gripper')
+        self.open_gripper()
+
+        log.debug('Moving back to above goal position')
+        self.ur.movel(target_above, self.acceleration, self.velocity)
+        log.info("Place completed")
 
 class VacuumGripperController():
     
@@ -289,4 +289,41 @@ class RobotiqGripper:
         # report the actual position and the object status
         final_pos = self._get_var(self.POS)
         final_obj = cur_obj
-        return final_pos, RobotiqGripper.ObjectStatus(final_obj)
\ No newline at end of file
+        return final_pos, RobotiqGripper.ObjectStatus(final_obj)
+
+# The gripper accepts a single session on its port, so all controllers in a process share one connection per address.
+# Each entry holds the gripper and the number of holders, the connection is closed when the last holder releases it
+_shared_grippers = {}
+_shared_grippers_lock = threading.Lock()
+
+def get_shared_gripper(hostname: str, port: int, socket_timeout: float = 2.0) -> RobotiqGripper:
+    """Returns the connected gripper for the given address, connecting only on the first request.
+    Every call must be paired with a release_shared_gripper call once the caller is done with the gripper.
+    :param hostname: Hostname or ip.
+    :param port: Port.
+    :param socket_timeout: Timeout for blocking socket operations, used when a new connection is made.
+    :return: The shared RobotiqGripper instance.
+    """
+    with _shared_grippers_lock:
+        entry = _shared_grippers.get((hostname, port))
+        if entry is None:
+            gripper = RobotiqGripper()
+            gripper.connect(hostname, port, socket_timeout)
+            entry = _shared_grippers[(hostname, port)] = [gripper, 0]
+        entry[1] += 1
+        return entry[0]
+
+def release_shared_gripper(hostname: str, port: int) -> None:
+    """Gives up one hold on the shared gripper at the given address, closing the connection once no holder is left.
+    :param hostname: Hostname or ip.
+    :param port: Port.
+    """
+    with _shared_grippers_lock:
+        entry = _shared_grippers.get((hostname, port))
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _shared_grippers[(hostname, port)]
+    entry[0].disconnect()
@@ -1,5 +1,5 @@
 from .interpreter_socket import InterpreterSocket
-from time import sleep
+from time import sleep, time
 
 class RobotiqScrewdriver:
     """
@@ -36,6 +36,23 @@ class RobotiqScrewdriver:
         """
         self.connection.disconnect()
 
+    def wait_until_done(self, timeout: float = 10, poll_interval: float = 0.05) -> bool:
+        """
+        Waits until the interpreter has executed every command sent so far, e.g. until a screwing action has finished.
+
+        Args:
+            timeout (float): (unit: seconds) Maximum time to wait.
+            poll_interval (float): (unit: seconds) Time between two queries of the interpreter queue.
+
+        Return (bool): True once all commands are executed, False if the timeout expired first.
+        """
+        start_time = time()
+        while time() - start_time < timeout:
+            if self.connection.get_unexecuted_count() == 0:
+                return True
+            sleep(poll_interval)
+        return False
+
     def get_status(self) -> str:
         """
         Retrieves the current activation status of the Screwdriver.       
@@ -1,11 +1,14 @@
 import os
+import logging
 
-from time import sleep
-from copy import deepcopy
+from time import sleep, time
+from contextlib import contextmanager
 import numpy as np
 
 from .robotiq_screwdriver_driver import RobotiqScrewdriver
 
+log = logging.getLogger(__name__)
+
 class ScrewdriverController():
 
     def __init__(self, hostname:str = None, ur = None, ur_dashboard = None):
@@ -17,6 +20,7 @@ class ScrewdriverController():
         self.hostname = hostname
         self.ur = None
         self.air_switch_digital_output = 0
+        self._air_switch_on = None # Unknown until the output is first set
 
         current_dir = os.getcwd()
         index = current_dir.find("ur_module")
@@ -34,7 +38,7 @@ class ScrewdriverController():
             self.screwdriver = RobotiqScrewdriver(hostname=self.hostname, socket_timeout=5)
             self.screwdriver.connect()
         except Exception as err:
-            print(err)
+            log.error("Screwdriver connection failed: %s", err)
         
         self.load_interpreter_socket_program()
         
@@ -47,8 +51,51 @@ class ScrewdriverController():
         if "File not found" in response:
             self.ur_dashboard.transfer_program(local_path = self.interpreter_urp, ur_path = iterpreter_program)
             response = self.ur_dashboard.load_program(iterpreter_program)
+        self._restart_interpreter()
+
+    def _restart_interpreter(self, timeout: float = 5) -> None:
+        """
+        Description: Starts the interpreter program and returns as soon as the interpreter socket answers a state query,
+                     instead of waiting the full start up time. The program is reported running before the interpreter accepts commands.
+        """
         self.ur_dashboard.run_program()
-        sleep(2)
+        start_time = time()
+        while time() - start_time < timeout:
+            if self.ur_dashboard.is_program_running():
+                try:
+                    self.screwdriver.connection.get_unexecuted_count()
+                    return
+                except Exception as err:
+                    log.debug("Interpreter not ready yet: %s", err)
+            sleep(0.05)
+        raise Exception("Interpreter program did not start within {} s".format(timeout))
+
+    def _wait_for_screwdriver(self, action: str) -> None:
+        """
+        Description: Waits until the queued screwdriver commands are executed, so the arm never moves with an unfinished command.
+        """
+        if not self.screwdriver.wait_until_done():
+            raise Exception("Screwdriver did not finish {} in time".format(action))
+
+    def _set_air_switch(self, on: bool) -> None:
+        """
+        Description: Sets the air switch output, skipping the write when the switch is already in the requested state.
+        """
+        if self._air_switch_on != on:
+            self.ur.set_digital_out(self.air_switch_digital_output, on)
+            self._air_switch_on = on
+
+    @contextmanager
+    def _air_on(self):
+        """
+        Description: Keeps the air switch on for the duration of the block and turns it off on exit.
+                     A switch that was already turned on (e.g. by pick_screw) is not written again.
+        """
+        self._set_air_switch(True)
+        try:
+            yield
+        finally:
+            self._set_air_switch(False)
 
     def pick_screw(self, screw_loc:list = None, approach_axis:str = None, approach_distance:float = None):
         """
@@ -75,23 +122,23 @@ class ScrewdriverController():
             axis = 0
             approach_distance = -approach_distance
 
-        screw_above = deepcopy(screw_loc)
+        screw_above = list(screw_loc)
         screw_above[axis] += approach_distance
-        screw_start_loc = deepcopy(screw_loc)
+        screw_start_loc = list(screw_loc)
         screw_start_loc[axis] += 0.01
 
-        print("Picking up the screw...")
+        log.debug("Picking up the screw...")
         
         self.ur.movel(screw_above,1,1)
         self.ur.movel(screw_start_loc,0.5,0.5)
-        self.ur.set_digital_out(self.air_switch_digital_output, True)
-        self.ur_dashboard.run_program() #Restart interpreter program
-        sleep(2)
+        # The air stays on after the pick, so the screw is held until place_screw drives it in
+        self._set_air_switch(True)
+        self._restart_interpreter()
         self.screwdriver.activate_vacuum()
         self.screwdriver.auto_screw()
-        sleep(4)    
+        self._wait_for_screwdriver("picking up the screw")
+        # movel returns once the robot reached the pose
         self.ur.movel(screw_above,1,0.5)
-        sleep(2)
 
     def place_screw(self, target:list = None, approach_axis:str = None, approach_distance:float = None):
         """
@@ -118,32 +165,27 @@ class ScrewdriverController():
             axis = 0
             approach_distance = -approach_distance
 
-        target_above = deepcopy(target)
+        target_above = list(target)
 
         target_above[axis] += approach_distance
  
-        print("Placing the screw to the target...")
-        sleep(1)
+        log.debug("Placing the screw to the target...")
         self.ur.movel(target_above,1,1)
-        self.ur.set_digital_out(self.air_switch_digital_output, True)
 
-        self.ur.movel(target,1,1)
-        sleep(1)
-        self.ur_dashboard.run_program() #Restart interpreter program
-        sleep(2)
-        self.screwdriver.activate_vacuum()
-        self.screwdriver.auto_screw(250)
-        sleep(2)
-        self.screwdriver.drive_clockwise(angle=200,rpm=100)
-        sleep(2)
-        self.screwdriver.deactivate_vacuum()
-        self.ur.set_digital_out(self.air_switch_digital_output, False)
-        sleep(1)
+        with self._air_on():
+            self.ur.movel(target,1,1)
+            self._restart_interpreter()
+            self.screwdriver.activate_vacuum()
+            self.screwdriver.auto_screw(250)
+            self._wait_for_screwdriver("screwing")
+            self.screwdriver.drive_clockwise(angle=200,rpm=100)
+            self.screwdriver.deactivate_vacuum()
+            self._wait_for_screwdriver("tightening the screw")
+        sleep(1) # Lets the air vent, there is no status to poll for the switch
         self.ur.movel(target_above,0.5,0.5)
-        sleep(2)
         # self.ur_dashboard.run_program() #Restart interpreter program
         # sleep(2)
-        print("Screw successfully placed")
+        log.info("Screw successfully placed")
 
         # if self.screwdriver.is_screw_detected() == "False":
         #     print("Screw successfully placed")
@@ -155,9 +197,9 @@ class ScrewdriverController():
         """Handles a screw transfer"""
 
         self.pick_screw(screw_loc = source, approach_axis = source_approach_axis, approach_distance = source_approach_dist)
-        print("Pick screw completed")
+        log.info("Pick screw completed")
         self.place_screw(target=target, approach_axis = target_approach_axis, approach_distance = target_approach_dist)
-        print("Place screw completed")
+        log.info("Place screw completed")
 
 if __name__ == "__main__":
     screwdrive = ScrewdriverController(hostname="164.54.116.129")
\ No newline at end of file
@@ -6,6 +6,7 @@ from std_msgs.msg import String
 from time import sleep
 import socket
 import json
+import logging
 
 from wei_interfaces.action import WeiAction
 
@@ -125,6 +126,8 @@ class UrActionServer(Node): #ACTION SERVER
         pass
 
 def main(args=None) -> None:
+    # The driver and tool controllers log every motion step at DEBUG, keep the node output to warnings and errors
+    logging.basicConfig(level=logging.WARNING)
     rclpy.init(args=args)
 
     ur_node = UrActionServer()